@@ -0,0 +1,313 @@
+# all_analysis/batch.py
+import csv
+import functools
+import glob
+import json
+import math
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from all_analysis.cube import MONTH_LABELS, ORIGINS, load_cube
+from all_analysis.errors import QueryError
+from all_analysis.query import parse_range, run_query
+from all_analysis.tourism_data import load_series
+
+# Columns every result row starts with
+KEY_COLUMNS = ('task', 'job', 'level', 'year', 'origin', 'analysis', 'regions')
+
+BatchTask = namedtuple('BatchTask', ['id', 'job', 'level', 'regions', 'year', 'origin', 'analysis'])
+
+# Rows a Parquet part holds before it is written out
+PARQUET_PART_ROWS = 500
+
+# Cubes and population joins of a worker process: level -> cube, ('per_capita', level) -> PerCapita
+_data = {}
+
+
+def _first(columns):
+    values = columns['value']
+    return values[0] if values else None
+
+
+def summary(level, regions, year, origin):
+    """Total, average monthly value, largest and smallest monthly value and share of the level total"""
+    cube = _data[level]
+
+    def query(agg, group_by=()):
+        return run_query(cube, regions, [year], origin=origin, agg=agg, group_by=group_by)
+
+    monthly_means = [v for v in query('mean', ('month',))['value'] if v is not None]
+    return {
+        'total': _first(query('sum')),
+        'average_monthly': float(np.mean(monthly_means)) if monthly_means else None,
+        'max_month': _first(query('max')),
+        'min_month': _first(query('min')),
+        'share': _first(query('share')),
+    }
+
+
+def seasonal(level, regions, year, origin):
+    """Monthly totals with the peak and low month and the seasonality index (std / mean)"""
+    columns = run_query(_data[level], regions, [year], origin=origin, agg='sum', group_by=('month',))
+    monthly_totals = pd.Series(columns['value'], index=columns['month'], dtype=np.float64)
+    if monthly_totals.empty:
+        return {}
+    return {
+        'peak_month': monthly_totals.idxmax(),
+        'low_month': monthly_totals.idxmin(),
+        'seasonality_index': float(monthly_totals.std() / monthly_totals.mean()),
+        **monthly_totals.to_dict(),
+    }
+
+
+def intensity(level, regions, year, origin):
+    """Guests per capita of the regions together, and the regions with the highest and lowest intensity"""
+    table = _data[('per_capita', level)].table(year, origin)
+    if regions:
+        table = table[table.index.isin(regions)]
+    if table.empty:
+        return {}
+    return {
+        'accommodation': float(table['accommodation'].sum()),
+        'population': float(table['population'].sum()),
+        'intensity': float(table['accommodation'].sum() / table['population'].sum()),
+        'highest_intensity_region': table['intensity'].idxmax(),
+        'highest_intensity': float(table['intensity'].max()),
+        'lowest_intensity_region': table['intensity'].idxmin(),
+        'lowest_intensity': float(table['intensity'].min()),
+    }
+
+
+# Analyses a job can ask for: name -> (function, result columns)
+ANALYSES = {
+    'summary': (summary, ('total', 'average_monthly', 'max_month', 'min_month', 'share')),
+    'seasonal': (seasonal, ('peak_month', 'low_month', 'seasonality_index') + tuple(MONTH_LABELS)),
+    'intensity': (intensity, ('accommodation', 'population', 'intensity', 'highest_intensity_region',
+                              'highest_intensity', 'lowest_intensity_region', 'lowest_intensity')),
+}
+
+COLUMNS = KEY_COLUMNS + tuple(dict.fromkeys(column for _, columns in ANALYSES.values() for column in columns))
+
+
+def load(levels, per_capita_levels=()):
+    """Load the cubes (and population joins) batch tasks read, once per process
+
+    Forked workers inherit what the parent loaded; spawned ones read the
+    columnar cache the parent wrote.
+    """
+    for level in levels:
+        if level not in _data:
+            _data[level] = load_cube(level)
+    for level in per_capita_levels:
+        if ('per_capita', level) not in _data:
+            _data[('per_capita', level)] = _data[level].per_capita(load_series(level, 'population'))
+
+
+def _years_text(years):
+    if years is None or isinstance(years, str):
+        return years
+    if isinstance(years, int):
+        return str(years)
+    return ','.join(str(year) for year in years)
+
+
+def expand_jobs(spec):
+    """Validate a job spec and expand it into one task per job, year, origin and analysis
+
+    A spec is {"jobs": [...]} where each job has a level, and optionally a
+    name, regions (codes, every region of the level when left out), years
+    (2023, "2019-2023" or a list; the latest year by default), origins
+    (["total"] by default) and analyses (every one of ANALYSES by default).
+    """
+    jobs = spec.get('jobs') if isinstance(spec, dict) else None
+    if not jobs:
+        raise QueryError('The job spec has no jobs')
+    tasks = []
+    names = set()
+    for i, job in enumerate(jobs):
+        name = str(job.get('name', f'job{i + 1}'))
+        if name in names:
+            raise QueryError(f'Duplicate job name {name!r}')
+        names.add(name)
+        try:
+            level = int(job['level'])
+            cube = load_cube(level)
+        except (KeyError, TypeError, ValueError):
+            raise QueryError(f'Job {name!r} needs a NUTS level') from None
+        except FileNotFoundError:
+            raise QueryError(f'Job {name!r}: no data for NUTS{level}') from None
+
+        regions = tuple(dict.fromkeys(job.get('regions') or ()))
+        missing = [code for code, position in zip(regions, cube.regions.get_indexer(regions)) if position < 0]
+        if missing:
+            raise QueryError(f'Job {name!r}: unknown NUTS{level} regions {missing}')
+        try:
+            years = parse_range(_years_text(job.get('years')), cube.years, 'years') if 'years' in job else [cube.years[-1]]
+        except QueryError as e:
+            raise QueryError(f'Job {name!r}: {e}') from None
+        origins = job.get('origins', ['total'])
+        unknown = [origin for origin in origins if origin not in ORIGINS]
+        if unknown:
+            raise QueryError(f'Job {name!r}: unknown origins {unknown}, expected any of {", ".join(ORIGINS)}')
+        analyses = job.get('analyses', list(ANALYSES))
+        unknown = [analysis for analysis in analyses if analysis not in ANALYSES]
+        if unknown:
+            raise QueryError(f'Job {name!r}: unknown analyses {unknown}, expected any of {", ".join(ANALYSES)}')
+
+        for year in years:
+            for origin in origins:
+                for analysis in analyses:
+                    tasks.append(BatchTask(f'{name}/{year}/{origin}/{analysis}', name, level, regions, year, origin, analysis))
+    return tasks
+
+
+def _plain(value):
+    # NumPy scalars as Python ones and NaN as missing, so every output format writes them alike
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+def run_task(task):
+    """Run one task and return its result row"""
+    function, _ = ANALYSES[task.analysis]
+    result = function(task.level, list(task.regions), task.year, task.origin)
+    row = {'task': task.id, 'job': task.job, 'level': task.level, 'year': task.year, 'origin': task.origin,
+           'analysis': task.analysis, 'regions': ','.join(task.regions)}
+    row.update((key, _plain(value)) for key, value in result.items())
+    return row
+
+
+def _complete_lines(path):
+    # Cut a last line left unfinished by an interrupted run and return the complete lines
+    with open(path, 'rb+') as f:
+        data = f.read()
+        end = data.rfind(b'\n') + 1
+        f.truncate(end)
+    return data[:end].decode('utf-8').splitlines()
+
+
+class JsonLinesOutput:
+    """One JSON object per result row, flushed as each task completes"""
+
+    def __init__(self, path, resume=False):
+        self.path = path
+        lines = _complete_lines(path) if resume and os.path.exists(path) else []
+        self.completed = {json.loads(line)['task'] for line in lines if line.strip()}
+        self._file = open(path, 'a' if resume else 'w', encoding='utf-8')
+
+    def write(self, row):
+        self._file.write(json.dumps(row) + '\n')
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class CsvOutput:
+    """Result rows with a column for every analysis result, flushed as each task completes"""
+
+    def __init__(self, path, resume=False):
+        self.path = path
+        lines = _complete_lines(path) if resume and os.path.exists(path) else []
+        if lines and tuple(next(csv.reader(lines[:1]))) != COLUMNS:
+            raise QueryError(f'{path} has different columns, so it cannot be resumed')
+        self.completed = {row['task'] for row in csv.DictReader(lines)}
+        self._file = open(path, 'a' if resume else 'w', encoding='utf-8', newline='')
+        self._writer = csv.DictWriter(self._file, COLUMNS)
+        if not lines:
+            self._writer.writeheader()
+
+    def write(self, row):
+        self._writer.writerow(row)
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetOutput:
+    """A directory of Parquet parts, each written in one step once it holds PARQUET_PART_ROWS rows
+
+    A run cut short loses at most the rows of the part it was filling; read
+    the whole result with pd.read_parquet(directory).
+    """
+
+    def __init__(self, path, resume=False):
+        # Fails early with pandas' message when neither pyarrow nor fastparquet is installed
+        pd.io.parquet.get_engine('auto')
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        parts = sorted(glob.glob(os.path.join(path, 'part-*.parquet')))
+        if not resume:
+            for part in parts:
+                os.remove(part)
+            parts = []
+        self.completed = {task for part in parts for task in pd.read_parquet(part, columns=['task'])['task']}
+        self._part = len(parts)
+        self._rows = []
+
+    def write(self, row):
+        self._rows.append(row)
+        if len(self._rows) >= PARQUET_PART_ROWS:
+            self._flush()
+
+    def _flush(self):
+        if not self._rows:
+            return
+        target = os.path.join(self.path, f'part-{self._part:05d}.parquet')
+        pd.DataFrame(self._rows, columns=list(COLUMNS)).to_parquet(f'{target}.tmp', index=False)
+        os.replace(f'{target}.tmp', target)
+        self._part += 1
+        self._rows = []
+
+    def close(self):
+        self._flush()
+
+
+OUTPUT_FORMATS = {'jsonl': JsonLinesOutput, 'csv': CsvOutput, 'parquet': ParquetOutput}
+
+
+def run_batch(tasks, output, workers=None, on_error=print):
+    """Run the tasks output has not completed yet and write each row as soon as it is ready
+
+    The data is loaded once in this process before the worker pool starts;
+    workers=1 runs every task here. Returns (written, skipped, failed).
+    """
+    pending = [task for task in tasks if task.id not in output.completed]
+    levels = sorted({task.level for task in pending})
+    per_capita_levels = sorted({task.level for task in pending if task.analysis == 'intensity'})
+    load(levels, per_capita_levels)
+
+    pool = None
+    if workers != 1 and len(pending) > 1:
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=load, initargs=(levels, per_capita_levels))
+    written = failed = 0
+    try:
+        if pool is None:
+            results = ((task, functools.partial(run_task, task)) for task in pending)
+        else:
+            futures = {pool.submit(run_task, task): task for task in pending}
+            # Rows are written in the order tasks finish, not the order of the spec
+            results = ((futures[future], future.result) for future in as_completed(futures))
+        for task, result in results:
+            try:
+                row = result()
+            except Exception as e:
+                # Failed tasks are not written, so a resumed run tries them again
+                on_error(f"Error in batch task {task.id}: {e}")
+                failed += 1
+                continue
+            output.write(row)
+            written += 1
+    finally:
+        output.close()
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    return written, len(tasks) - len(pending), failed
@@ -0,0 +1,68 @@
+# all_analysis/cleaning.py
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+# Eurostat observation flags, stored as a bit mask per cell
+FLAG_BITS = {
+    ':': 1,      # not available
+    'b': 2,      # break in time series
+    'c': 4,      # confidential
+    'd': 8,      # definition differs
+    'e': 16,     # estimated
+    'f': 32,     # forecast
+    'n': 64,     # not significant
+    'p': 128,    # provisional
+    'r': 256,    # revised
+    's': 512,    # Eurostat estimate
+    'u': 1024,   # low reliability
+    'z': 2048,   # not applicable
+}
+FLAG_CHARS = ''.join(FLAG_BITS)
+
+CleanedDataset = namedtuple('CleanedDataset', ['frame', 'flags'])
+
+
+def parse_values(block):
+    """Parse a 2-D block of raw cells into float64 values and a uint16 flag mask"""
+    block = np.asarray(block, dtype=object)
+    flat = block.ravel()
+
+    # Plain numbers and numeric strings go through a single vectorized conversion
+    values = pd.to_numeric(flat, errors='coerce').astype(np.float64)
+    flags = np.zeros(flat.shape, dtype=np.uint16)
+
+    # Only cells that failed the fast path and were not empty need text parsing
+    pending = np.flatnonzero(np.isnan(values) & ~pd.isna(flat))
+    if len(pending):
+        text = np.char.lower(np.char.strip(flat[pending].astype(str)))
+        for flag, bit in FLAG_BITS.items():
+            flags[pending[np.char.find(text, flag) >= 0]] |= bit
+
+        # Drop trailing flags, digit-grouping commas and spaces, then convert the rest
+        body = np.char.rstrip(text, FLAG_CHARS + ' ')
+        body = np.char.replace(np.char.replace(body, ',', ''), ' ', '')
+        values[pending] = pd.to_numeric(body, errors='coerce')
+
+    return values.reshape(block.shape), flags.reshape(block.shape)
+
+
+def clean_workbook(df, label_column=0):
+    """Split a raw sheet into a read-only numeric frame and its per-cell flags
+
+    The label column (region codes) is kept as is, every other column is parsed
+    in one pass and rows without any value are dropped.
+    """
+    numeric_cols = df.columns.delete(label_column)
+    values, flags = parse_values(df[numeric_cols].to_numpy(dtype=object))
+
+    keep = ~np.isnan(values).all(axis=1)
+    if not keep.all():
+        values, flags = values[keep], flags[keep]
+    values.flags.writeable = False
+    flags.flags.writeable = False
+
+    frame = pd.DataFrame(values, index=df.index[keep], columns=numeric_cols, copy=False)
+    frame.insert(label_column, df.columns[label_column], df.iloc[keep, label_column].to_numpy())
+    return CleanedDataset(frame, flags)
@@ -0,0 +1,26 @@
+# all_analysis/compression.py
+import gzip
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Content codings we can produce, most preferred first
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+# File suffix of each coding in a precompressed static export
+SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+# Bodies smaller than this are sent as they are
+MIN_SIZE = 1024
+
+
+def compress(body, encoding, best=False):
+    """Compress a body with a content coding; best trades time for size, for output built once"""
+    if encoding == 'gzip':
+        # mtime=0 keeps the output identical for identical bodies
+        return gzip.compress(body, compresslevel=9 if best else 6, mtime=0)
+    if encoding == 'br' and brotli is not None:
+        return brotli.compress(body, quality=11 if best else 5)
+    raise ValueError(f'Unsupported content coding {encoding!r}')
@@ -0,0 +1,121 @@
+# all_analysis/computation.py
+import functools
+import threading
+import time
+from collections import OrderedDict
+
+from all_analysis.metrics import cache_lookup, timed
+
+# Number of (analyzer, dataset version) graphs kept alive at once
+MAX_GRAPHS = 32
+
+
+class ComputationGraph:
+    """Memoized intermediate results of one analyzer for one version of the series it reads"""
+
+    def __init__(self, owner, versions):
+        self.owner = owner
+        # (level, origin) -> version of every series the analyzer reads
+        self.versions = versions
+        self._results = {}
+        # Series each result was declared to depend on, None for all of them
+        self._depends = {}
+        self._stats = OrderedDict()
+        self._lock = threading.Lock()
+        self._node_locks = {}
+
+    def _node_lock(self, name):
+        with self._lock:
+            return self._node_locks.setdefault(name, threading.Lock())
+
+    def compute(self, name, func, depends=None):
+        """Return the result for name, running func only the first time it is requested"""
+        if name in self._results:
+            cache_lookup('graph', True)
+            self._stats[name]['hits'] += 1
+            return self._results[name]
+
+        with self._node_lock(name):
+            if name not in self._results:
+                cache_lookup('graph', False)
+                start = time.perf_counter()
+                with timed(f"compute.{name.split('(')[0]}"):
+                    result = func()
+                # Timings are inclusive of any nodes computed while building this one
+                self._stats[name] = {'seconds': time.perf_counter() - start, 'hits': 0}
+                self._depends[name] = depends
+                self._results[name] = result
+                return result
+
+        cache_lookup('graph', True)
+        self._stats[name]['hits'] += 1
+        return self._results[name]
+
+    def inherit(self, previous):
+        """Reuse the results of an older graph whose declared series have the same version here"""
+        carried = 0
+        with self._lock:
+            for name, depends in list(previous._depends.items()):
+                if depends is None or name in self._results:
+                    continue
+                if all(previous.versions.get(series) == self.versions.get(series) for series in depends):
+                    self._stats[name] = {**previous._stats[name], 'hits': 0}
+                    self._depends[name] = depends
+                    self._results[name] = previous._results[name]
+                    carried += 1
+        return carried
+
+    def report(self):
+        """List every computed node in evaluation order with its build time and reuse count"""
+        return [{'name': name, **stats} for name, stats in list(self._stats.items())]
+
+
+_graphs = OrderedDict()
+_graphs_lock = threading.Lock()
+
+
+def graph_for(owner, versions, *params):
+    """Return the shared computation graph for an analyzer, the versions of its series and its parameters
+
+    A new graph starts with the results of the latest graph of the same
+    analyzer and parameters that only depend on series which did not change.
+    """
+    key = (owner, tuple(sorted(versions.items())), params)
+    with _graphs_lock:
+        graph = _graphs.get(key)
+        if graph is None:
+            graph = ComputationGraph(owner, versions)
+            previous = next((g for (o, _, p), g in reversed(_graphs.items()) if o == owner and p == params), None)
+            if previous is not None:
+                graph.inherit(previous)
+            _graphs[key] = graph
+            while len(_graphs) > MAX_GRAPHS:
+                _graphs.popitem(last=False)
+        else:
+            _graphs.move_to_end(key)
+        return graph
+
+
+def clear_graphs():
+    """Drop every computation graph"""
+    with _graphs_lock:
+        _graphs.clear()
+
+
+def depends_on(*series):
+    """Declare the (level, origin) series a memoized method reads, so its result survives changes to the others"""
+    def decorate(method):
+        method.depends_on = series
+        return method
+    return decorate
+
+
+def memoized(method):
+    """Cache an analyzer method's result in the analyzer's computation graph"""
+    depends = getattr(method, 'depends_on', None)
+
+    @functools.wraps(method)
+    def wrapper(self, *args):
+        name = method.__name__ if not args else f"{method.__name__}({', '.join(map(str, args))})"
+        return self.graph.compute(name, lambda: method(self, *args), depends)
+    return wrapper
@@ -0,0 +1,80 @@
+# all_analysis/config.py
+import os
+
+# Directory for the columnar cache of cleaned workbooks (empty string disables it)
+CACHE_DIR = os.environ.get('TOURISM_CACHE_DIR', 'cache')
+
+# Directory the aggregate cubes are published to as memory-mapped blocks, shared by every
+# worker process (e.g. /dev/shm/tourism to keep them in shared memory; empty string disables)
+SHARED_CUBE_DIR = os.environ.get('TOURISM_SHARED_CUBE_DIR', os.path.join(CACHE_DIR, 'cubes') if CACHE_DIR else '')
+
+# Upper bound on the memory used by cached page and plot responses
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get('TOURISM_RESPONSE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+
+# Directory holding the source workbooks
+DATA_DIR = os.environ.get('TOURISM_DATA_DIR', 'data')
+
+# Eurostat bulk downloads in DATA_DIR (tour_occ_*.tsv[.gz] or SDMX-CSV tour_occ_*.csv[.gz]) are read
+# alongside the workbooks, keeping only these NUTS levels, unit, NACE activity and years ('2019-2023';
+# empty keeps every year), a chunk of this many rows at a time
+EUROSTAT_LEVELS = tuple(int(v) for v in os.environ.get('TOURISM_EUROSTAT_LEVELS', '1,2').split(','))
+EUROSTAT_UNIT = os.environ.get('TOURISM_EUROSTAT_UNIT', 'NR')
+EUROSTAT_NACE = os.environ.get('TOURISM_EUROSTAT_NACE', 'I551-I553')
+EUROSTAT_YEARS = os.environ.get('TOURISM_EUROSTAT_YEARS', '')
+EUROSTAT_CHUNK_ROWS = int(os.environ.get('TOURISM_EUROSTAT_CHUNK_ROWS', 2000))
+
+# Year the recovery index compares every month against (the same month of this year is 100)
+GROWTH_BASELINE_YEAR = int(os.environ.get('TOURISM_GROWTH_BASELINE_YEAR', 2019))
+
+# Seconds between checks of the data directory for changed workbooks (0 disables hot reload)
+DATA_RELOAD_INTERVAL = float(os.environ.get('TOURISM_DATA_RELOAD_INTERVAL', 0))
+
+# How independent workbooks and figures are processed: serial, thread or process. Web workers
+# should not fork a process pool per cold request, so process mode is opt-in (the CLI
+# commands take --processes)
+EXECUTION_MODE = os.environ.get('TOURISM_EXECUTION_MODE', 'thread')
+
+# Cap on worker threads or processes (0 lets the executor pick from the CPU count)
+MAX_WORKERS = int(os.environ.get('TOURISM_MAX_WORKERS', 0)) or None
+
+# Seconds a request waits for a concurrent identical render before answering 503
+SINGLE_FLIGHT_TIMEOUT = float(os.environ.get('TOURISM_SINGLE_FLIGHT_TIMEOUT', 60))
+
+# After a data change, serve the previous response while the new one renders in the background
+STALE_WHILE_REVALIDATE = os.environ.get('TOURISM_STALE_WHILE_REVALIDATE', '0') == '1'
+
+# Compress page and figure responses with gzip (or brotli when installed) for clients that accept it
+COMPRESS_RESPONSES = os.environ.get('TOURISM_COMPRESS_RESPONSES', '1') == '1'
+
+# Add a Server-Timing header with per-stage durations to every response
+SERVER_TIMING = os.environ.get('TOURISM_SERVER_TIMING', '0') == '1'
+
+# Sample the stacks of requests and keep a profile of those slower than this many milliseconds (0 disables)
+PROFILE_SLOW_MS = int(os.environ.get('TOURISM_PROFILE_SLOW_MS', 0))
+PROFILE_INTERVAL_MS = float(os.environ.get('TOURISM_PROFILE_INTERVAL_MS', 5))
+PROFILE_DIR = os.environ.get('TOURISM_PROFILE_DIR', os.path.join('cache', 'profiles'))
+
+# Figure serialization: orjson (falls back to json when it is not installed), json or plotly
+PLOT_BACKENDS = ('orjson', 'json', 'plotly')
+PLOT_BACKEND = os.environ.get('TOURISM_PLOT_BACKEND', 'orjson')
+
+# Send numeric traces at least this long as base64 typed arrays (0 disables; needs plotly.js 2.28+)
+PLOT_TYPED_ARRAY_MIN = int(os.environ.get('TOURISM_PLOT_TYPED_ARRAY_MIN', 0))
+
+# Round floats in figures to this many decimals (negative keeps them exact)
+PLOT_FLOAT_DECIMALS = int(os.environ.get('TOURISM_PLOT_FLOAT_DECIMALS', 4))
+
+# Send common layout templates (plotly_white) once per page instead of inside every figure
+PLOT_SHARED_TEMPLATES = os.environ.get('TOURISM_PLOT_SHARED_TEMPLATES', '1') == '1'
+
+# plotly.js bundle loaded by the dashboards
+PLOTLY_JS_URL = os.environ.get(
+    'TOURISM_PLOTLY_JS_URL',
+    'https://cdn.plot.ly/plotly-2.35.2.min.js' if PLOT_TYPED_ARRAY_MIN else 'https://cdn.plot.ly/plotly-latest.min.js',
+)
+
+# Most categories a bar chart sends before the smallest are summed into "Other" (0 disables)
+PLOT_MAX_BARS = int(os.environ.get('TOURISM_PLOT_MAX_BARS', 60))
+
+# Most points a line trace sends before it is LTTB-downsampled (0 disables)
+PLOT_MAX_POINTS = int(os.environ.get('TOURISM_PLOT_MAX_POINTS', 1000))
@@ -0,0 +1,432 @@
+# all_analysis/cube.py
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from all_analysis import config
+from all_analysis.dataset_store import file_variant, keep_version, prefetch
+from all_analysis.growth import GROWTH_METRICS, Growth, timeline
+from all_analysis.metrics import cache_lookup, timed
+from all_analysis.seasonality import METRICS, seasonality
+from all_analysis.shared_arrays import attach_arrays, prune_arrays, publish_arrays
+from all_analysis.tourism_data import load_series, series_files, series_version
+
+# Visitor origins held by the cube, in axis order
+ORIGINS = ('total', 'domestic', 'foreign')
+MONTHS = np.arange(1, 13)
+MONTH_LABELS = pd.Index([f'M{m:02d}' for m in MONTHS])
+STATS = ('sum', 'count', 'mean', 'max', 'min')
+ROLLUPS = ('by_region', 'by_month', 'by_year')
+
+
+def _rollup(values, axis):
+    """NaN-aware sum, count, max and min of a block along the given axes"""
+    present = ~np.isnan(values)
+    return {
+        'sum': np.nansum(values, axis=axis, dtype=np.float64),
+        'count': present.sum(axis=axis),
+        # fmax/fmin skip NaN without warnings and stay NaN when everything is missing
+        'max': np.fmax.reduce(values, axis=axis, initial=np.nan).astype(np.float64),
+        'min': np.fmin.reduce(values, axis=axis, initial=np.nan).astype(np.float64),
+    }
+
+
+def _rollups(values):
+    """The rollups of a cube's values along each axis, with the region ranking"""
+    rollups = {
+        # Over months: one figure per region, year and origin
+        'by_region': _rollup(values, axis=2),
+        # Over regions: one figure per year, month and origin
+        'by_month': _rollup(values, axis=0),
+        # Over regions and months: one figure per year and origin
+        'by_year': _rollup(values, axis=(0, 2)),
+    }
+    for name in ROLLUPS:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            rollups[name]['mean'] = rollups[name]['sum'] / rollups[name]['count']
+
+    # Regions ordered by yearly total, largest first, for top-N lookups
+    by_region = rollups['by_region']
+    ranked = np.where(by_region['count'] > 0, by_region['sum'], -np.inf)
+    rollups['region_rank'] = np.argsort(-ranked, axis=0, kind='stable')
+    return rollups
+
+
+class AggregateCube:
+    """Region × year × month × origin cube for one NUTS level, with rollups along each axis
+
+    Built once per dataset version; every statistic the dashboards show is
+    answered by indexing one of the precomputed rollups. The values and
+    rollups can be published to memory-mapped files (see publish and attach)
+    so every worker process shares one copy of them; so are the metrics
+    derived from an attached cube (see derived_arrays).
+    """
+
+    def __init__(self, level, regions, years, values, version, rollups=None):
+        self.level = level
+        self.regions = pd.Index(regions)
+        self.years = list(years)
+        self.values = values
+        self.version = version
+        self._year_index = {year: i for i, year in enumerate(self.years)}
+
+        rollups = _rollups(values) if rollups is None else rollups
+        self.by_region = rollups['by_region']
+        self.by_month = rollups['by_month']
+        self.by_year = rollups['by_year']
+        self.region_rank = rollups['region_rank']
+
+        self._per_capita = None
+        self._per_capita_lock = threading.Lock()
+        # Directory the cube is mapped from, None for a private cube
+        self.shared_path = None
+        self._seasonality = None
+        self._growth = None
+        # The cube this one replaced, whose growth metrics are updated rather than recomputed
+        self.predecessor = None
+
+    @classmethod
+    def from_series(cls, level, series_by_origin, version):
+        """Materialize the cube from the long series of each origin"""
+        regions = pd.Index([])
+        years = set()
+        for series in series_by_origin.values():
+            regions = regions.append(series.regions.difference(regions, sort=False))
+            years.update(series.years())
+        years = sorted(years)
+
+        values = np.full((len(regions), len(years), len(MONTHS), len(ORIGINS)), np.nan, dtype=np.float32)
+        for origin, series in series_by_origin.items():
+            table = series.table
+            region_codes = regions.get_indexer(series.regions)[table['region'].cat.codes.to_numpy()]
+            year_codes = np.searchsorted(years, table['year'].to_numpy())
+            values[region_codes, year_codes, table['month'].to_numpy() - 1, ORIGINS.index(origin)] = \
+                table['value'].to_numpy()
+        values.flags.writeable = False
+        return cls(level, regions, years, values, version)
+
+    def publish(self, path):
+        """Write the values and rollups as memory-mappable blocks with the labels in a metadata header"""
+        arrays = {'values': self.values, 'region_rank': self.region_rank}
+        for name in ROLLUPS:
+            arrays.update((f'{name}.{stat}', array) for stat, array in getattr(self, name).items())
+        publish_arrays(path, arrays, {
+            'level': self.level,
+            'regions': [str(region) for region in self.regions],
+            'years': [int(year) for year in self.years],
+            'version': list(self.version),
+        })
+
+    @classmethod
+    def attach(cls, path, version):
+        """Map a cube another process published at path without copying it, or return None"""
+        attached = attach_arrays(path)
+        if attached is None:
+            return None
+        arrays, meta = attached
+        if tuple(meta['version']) != tuple(version):
+            return None
+        rollups = {name: {stat: arrays[f'{name}.{stat}'] for stat in STATS} for name in ROLLUPS}
+        rollups['region_rank'] = arrays['region_rank']
+        cube = cls(meta['level'], meta['regions'], meta['years'], arrays['values'], version, rollups)
+        cube.shared_path = path
+        return cube
+
+    def derived_arrays(self, name, build):
+        """Named arrays computed from the cube by build(), published next to it when the cube is shared
+
+        The first process to need them builds and publishes them; every
+        other one maps the same copy. A private cube keeps its own.
+        """
+        if self.shared_path is None:
+            return build()
+        path = f'{self.shared_path}.{name}'
+        attached = attach_arrays(path)
+        cache_lookup(f'shared_{name.split("-")[0]}', attached is not None)
+        if attached is not None:
+            return attached[0]
+        arrays = build()
+        try:
+            publish_arrays(path, arrays, {'version': list(self.version)})
+        except OSError as e:
+            print(f"Could not publish {name} of the NUTS{self.level} cube to {path}: {e}")
+            return arrays
+        attached = attach_arrays(path)
+        return arrays if attached is None else attached[0]
+
+    def _year(self, year):
+        try:
+            return self._year_index[year]
+        except KeyError:
+            raise KeyError(f'No NUTS{self.level} data for {year}') from None
+
+    def origin_years(self, origin):
+        """Years with at least one observation of an origin, in ascending order"""
+        present = self.by_year['count'][:, ORIGINS.index(origin)] > 0
+        return [year for year, kept in zip(self.years, present) if kept]
+
+    def total(self, stat, year, origin):
+        """Statistic over every region and month of a year"""
+        return float(self.by_year[stat][self._year(year), ORIGINS.index(origin)])
+
+    def monthly(self, stat, year, origin):
+        """Statistic across regions for each month that has data, indexed M01..M12"""
+        y, o = self._year(year), ORIGINS.index(origin)
+        present = self.by_month['count'][y, :, o] > 0
+        return pd.Series(self.by_month[stat][y, present, o], index=MONTH_LABELS[present])
+
+    def regional(self, stat, year, origin):
+        """Statistic across months for each region that has data, indexed by region code"""
+        y, o = self._year(year), ORIGINS.index(origin)
+        present = self.by_region['count'][:, y, o] > 0
+        return pd.Series(self.by_region[stat][present, y, o], index=self.regions[present])
+
+    def top_regions(self, year, origin, n=5):
+        """The n regions with the largest yearly total"""
+        y, o = self._year(year), ORIGINS.index(origin)
+        order = self.region_rank[:, y, o]
+        order = order[self.by_region['count'][order, y, o] > 0][:n]
+        return pd.Series(self.by_region['sum'][order, y, o], index=self.regions[order])
+
+    def per_capita(self, population):
+        """The cube joined to a population series by region code, built once per population version"""
+        with self._per_capita_lock:
+            if self._per_capita is None or self._per_capita.population_version != population.version:
+                with timed('per_capita_join'):
+                    self._per_capita = PerCapita(self, population)
+            return self._per_capita
+
+    def seasonality(self):
+        """Seasonality metrics of every region, year and origin (see all_analysis.seasonality), computed once
+
+        About the size of the cube's values; published with a shared cube,
+        else held by every process.
+        """
+        with self._per_capita_lock:
+            if self._seasonality is None:
+                def build():
+                    with timed('seasonality'):
+                        return seasonality(self.values, ORIGINS.index('domestic'), ORIGINS.index('foreign'))
+                self._seasonality = self.derived_arrays('seasonality', build)
+            return self._seasonality
+
+    def regional_seasonality(self, year, origin='total'):
+        """Seasonality metrics of each region with at least two months of data in a year, indexed by region code"""
+        y, o = self._year(year), ORIGINS.index(origin)
+        metrics = self.seasonality()
+        present = metrics['peak_month'][:, y, o] > 0
+        frame = pd.DataFrame({name: metrics[name][present, y, o] for name in METRICS}, index=self.regions[present])
+        frame['divergence'] = metrics['divergence'][present, y]
+        return frame
+
+    def seasonal_divergence(self, year):
+        """Divergence between domestic and foreign monthly shares of each region with both in a year
+
+        Reads only the domestic and foreign figures, never the totals.
+        """
+        divergence = self.seasonality()['divergence'][:, self._year(year)]
+        present = ~np.isnan(divergence)
+        return pd.Series(divergence[present], index=self.regions[present])
+
+    def growth(self):
+        """Growth metrics of every region, month and origin (see all_analysis.growth), computed once
+
+        When the cube this one replaced computed them, only the months from
+        the first one whose data changed are recomputed. The timeline and
+        metrics are float64, about 12x the cube's values in size; they are
+        published with a shared cube, else held by every process.
+        """
+        with self._per_capita_lock:
+            if self._growth is None:
+                baseline_year = config.GROWTH_BASELINE_YEAR
+                predecessor = self.predecessor
+                previous = predecessor._growth if predecessor is not None else None
+
+                def build():
+                    values = timeline(self.years, self.values)
+                    if previous is None:
+                        with timed('growth'):
+                            return Growth(self.regions, self.years[0], values, baseline_year).arrays()
+                    with timed('growth_update'):
+                        return previous.update(self.regions, self.years[0], values, baseline_year).arrays()
+
+                arrays = self.derived_arrays(f'growth-{baseline_year}', build)
+                self._growth = Growth.from_arrays(self.regions, self.years[0], baseline_year, arrays)
+                self.predecessor = None
+            return self._growth
+
+    def regional_growth(self, year, month, origin='total'):
+        """Value and growth metrics of each region with data for a month, indexed by region code"""
+        self._year(year)
+        growth = self.growth()
+        t, o = (year - growth.first_year) * 12 + month - 1, ORIGINS.index(origin)
+        values = growth.values[:, t, o]
+        present = ~np.isnan(values)
+        frame = pd.DataFrame({name: growth.metrics[name][present, t, o] for name in GROWTH_METRICS},
+                             index=self.regions[present])
+        frame.insert(0, 'value', values[present])
+        return frame
+
+    def shares(self, year):
+        """Domestic and foreign totals of a year with their percentage of the combined total"""
+        domestic = self.total('sum', year, 'domestic')
+        foreign = self.total('sum', year, 'foreign')
+        total_visitors = domestic + foreign
+        # A year holding only total-origin data has no split to report
+        return {
+            'domestic_percentage': (domestic / total_visitors) * 100 if total_visitors else 0.0,
+            'foreign_percentage': (foreign / total_visitors) * 100 if total_visitors else 0.0,
+            'total_visitors': total_visitors,
+        }
+
+
+class PerCapita:
+    """Accommodation of a cube joined to population on NUTS region codes
+
+    The join is one hash lookup of the cube's region codes in the population
+    series, giving a region × year population array aligned with the cube;
+    per-capita figures for any year and origin are then plain array division.
+    """
+
+    def __init__(self, cube, population):
+        self.cube = cube
+        self.population_version = population.version
+        regions, periods, values = population.matrix()
+
+        # Row of each cube region in the population matrix, -1 when it has no population figures
+        rows = pd.Index(regions).get_indexer(cube.regions)
+        # Population of the same year, else the latest before it (the earliest for years before any)
+        population_years = np.asarray(periods.get_level_values('year'))
+        columns = np.clip(np.searchsorted(population_years, cube.years, side='right') - 1, 0, None)
+        joined = values[np.ix_(np.maximum(rows, 0), columns)].astype(np.float64)
+        joined[rows < 0] = np.nan
+        joined.flags.writeable = False
+        self.population = joined
+
+    def table(self, year, origin='total'):
+        """Accommodation, population and guests per capita of each region with both figures for a year"""
+        y, o = self.cube._year(year), ORIGINS.index(origin)
+        accommodation = self.cube.by_region['sum'][:, y, o]
+        population = self.population[:, y]
+        present = (self.cube.by_region['count'][:, y, o] > 0) & (population > 0)
+        return pd.DataFrame({
+            'accommodation': accommodation[present],
+            'population': population[present],
+            'intensity': accommodation[present] / population[present],
+        }, index=self.cube.regions[present])
+
+
+def cube_files(level, data_dir=None):
+    """Paths of every workbook the cube of a NUTS level is built from"""
+    return [path for origin in ORIGINS for path in series_files(level, origin, data_dir)]
+
+
+def latest_common_year(series, data_dir=None):
+    """Latest year with data in every accommodation (level, origin) series, from their cubes
+
+    Other series, such as population, are joined to the latest year before
+    the one asked for and do not constrain it.
+    """
+    years = None
+    for level, origin in series:
+        if origin in ORIGINS:
+            present = set(load_cube(level, data_dir).origin_years(origin))
+            years = present if years is None else years & present
+    if not years:
+        raise KeyError(f'No year has data in every one of {list(series)}')
+    return max(years)
+
+
+def _shared_cube_prefix(level, data_dir):
+    # Every version of the cube of one level and data directory is published under this prefix
+    source = hashlib.sha256(os.path.abspath(data_dir or config.DATA_DIR).encode()).hexdigest()[:8]
+    return f'nuts{level}-{source}-'
+
+
+def shared_cube_path(level, version, data_dir=None):
+    """Directory a cube version is published to under config.SHARED_CUBE_DIR, None when sharing is off"""
+    if not config.SHARED_CUBE_DIR:
+        return None
+    # The version follows file contents only; what is kept of Eurostat bulk files also depends on the filters
+    variants = sorted({file_variant(path) for path in cube_files(level, data_dir)} - {''})
+    digest = hashlib.sha256(repr((level, version, variants)).encode()).hexdigest()[:20]
+    return os.path.join(config.SHARED_CUBE_DIR, _shared_cube_prefix(level, data_dir) + digest)
+
+
+def _build_cube(level, data_dir, version):
+    # Attach the cube another worker already published, else build it from the series and publish it
+    path = shared_cube_path(level, version, data_dir)
+    if path is not None:
+        cube = AggregateCube.attach(path, version)
+        cache_lookup('shared_cube', cube is not None)
+        if cube is not None:
+            return cube
+
+    prefetch(cube_files(level, data_dir))
+    series_by_origin = {
+        origin: load_series(level, origin, data_dir)
+        for origin in ORIGINS if series_files(level, origin, data_dir)
+    }
+    with timed('cube_build'):
+        cube = AggregateCube.from_series(level, series_by_origin, version)
+    if path is not None:
+        try:
+            cube.publish(path)
+        except OSError as e:
+            print(f"Could not publish the NUTS{level} cube to {path}: {e}")
+            return cube
+        # Earlier versions are superseded; left behind they would fill the disk (or /dev/shm)
+        prune_arrays(path, _shared_cube_prefix(level, data_dir))
+        # Serve the mapped copy too, so this process holds no private copy of the cube either
+        cube = AggregateCube.attach(path, version) or cube
+    return cube
+
+
+# (data_dir, level) -> {version: cube}
+_cubes = {}
+_cubes_lock = threading.Lock()
+
+
+def load_cube(level, data_dir=None):
+    """Return the aggregate cube of a NUTS level, rebuilding it only when its files change"""
+    version = tuple(series_version(level, origin, data_dir)
+                    for origin in ORIGINS if series_files(level, origin, data_dir))
+    if not version:
+        raise FileNotFoundError(f'No data files for NUTS{level}')
+
+    key = (data_dir, level)
+    cube = _cubes.get(key, {}).get(version)
+    if cube is None:
+        with _cubes_lock:
+            cube = _cubes.get(key, {}).get(version)
+            if cube is None:
+                versions = _cubes.setdefault(key, OrderedDict())
+                cube = _build_cube(level, data_dir, version)
+                if versions:
+                    # Only the latest replaced cube is linked, so no chain of old versions is kept alive
+                    cube.predecessor = versions[next(reversed(versions))]
+                    cube.predecessor.predecessor = None
+                cube = keep_version(versions, version, cube)
+    return cube
+
+
+def prune_cubes():
+    """Drop the cubes built from series versions that are no longer served"""
+    with _cubes_lock:
+        for (data_dir, level), versions in list(_cubes.items()):
+            version = tuple(series_version(level, origin, data_dir)
+                            for origin in ORIGINS if series_files(level, origin, data_dir))
+            for stale in [v for v in versions if v != version]:
+                del versions[stale]
+            if not versions:
+                del _cubes[(data_dir, level)]
+
+
+def clear_cubes():
+    """Drop every cached cube"""
+    with _cubes_lock:
+        _cubes.clear()
@@ -0,0 +1,111 @@
+# all_analysis/data_manager.py
+import os
+import threading
+
+from all_analysis import config
+from all_analysis.cube import prune_cubes
+from all_analysis.dataset_store import building, disk_signature, prefetch, publish, store
+from all_analysis.metrics import registry, timed
+from all_analysis.registry import analyzer_class, loaded_pages
+from all_analysis.tourism_data import is_data_file, prune_series
+
+
+def _abspaths(paths):
+    return {os.path.abspath(path) for path in paths}
+
+
+class DataManager:
+    """Poll the data directory and hot-swap changed workbooks
+
+    Requests are served from a published snapshot of the data files. When a
+    workbook changes, only it is parsed again, and only the series, cubes and
+    analyzer results built from it are recomputed, in the background against
+    the next snapshot; that snapshot is then published in one step.
+    """
+
+    def __init__(self, data_dir=None, interval=None):
+        self.data_dir = data_dir
+        self.interval = config.DATA_RELOAD_INTERVAL if interval is None else interval
+        self.snapshot = None
+        self._last_scan = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def scan(self):
+        """Signatures of the data files on disk, {absolute path: (mtime, size)}"""
+        data_dir = os.path.abspath(config.DATA_DIR if self.data_dir is None else self.data_dir)
+        snapshot = {}
+        for name in sorted(os.listdir(data_dir)):
+            if is_data_file(name):
+                path = os.path.join(data_dir, name)
+                try:
+                    snapshot[path] = disk_signature(path)
+                except FileNotFoundError:
+                    continue
+        return snapshot
+
+    def start(self):
+        """Publish the data files as they are now and start polling for changes"""
+        self.snapshot = self._last_scan = self.scan()
+        publish(self.snapshot)
+        if self.interval and self._thread is None:
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name='data-manager', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop polling and serve the data files straight from disk again"""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        publish(None)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.check()
+
+    def check(self):
+        """Reload the changed data files once they have stayed the same for a whole interval"""
+        scan = self.scan()
+        # A workbook still being copied in changes between two checks; wait until it settles
+        settled = scan == self._last_scan
+        self._last_scan = scan
+        if not settled or scan == self.snapshot:
+            return set()
+        return self.reload(scan)
+
+    def reload(self, snapshot=None):
+        """Rebuild what depends on the changed data files, publish them and return their paths"""
+        with self._lock:
+            snapshot = self.scan() if snapshot is None else snapshot
+            previous = self.snapshot or {}
+            changed = {path for path in previous.keys() | snapshot.keys() if previous.get(path) != snapshot.get(path)}
+            if not changed:
+                return changed
+
+            # Analyzers that have not served a request yet are left to load on demand
+            pages = {page: analyzer_class(page) for page in loaded_pages()}
+            served_files = {page: _abspaths(cls.data_files()) for page, cls in pages.items()}
+            try:
+                with timed('data_reload'), building(snapshot):
+                    prefetch(path for path in changed if path in snapshot)
+                    for page, cls in pages.items():
+                        if changed & (served_files[page] | _abspaths(cls.data_files())):
+                            cls().get_full_analysis()
+            except Exception as e:
+                # Keep serving the previous snapshot; the next check tries again
+                print(f"Error reloading data: {e}")
+                registry.increment('tourism_data_reloads_total', result='error')
+                self._last_scan = None
+                return set()
+
+            self.snapshot = snapshot
+            publish(snapshot)
+            store.prune()
+            prune_series()
+            prune_cubes()
+            registry.increment('tourism_data_reloads_total', result='ok')
+            return changed
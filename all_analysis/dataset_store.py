@@ -0,0 +1,210 @@
+# all_analysis/dataset_store.py
+import contextlib
+import contextvars
+import functools
+import hashlib
+import os
+import threading
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from all_analysis import config, disk_cache
+from all_analysis.cleaning import clean_workbook
+from all_analysis.eurostat import bulk_filter, is_bulk_file, read_bulk
+from all_analysis.executor import execution_mode, parallel_map
+from all_analysis.metrics import cache_lookup, timed
+
+DatasetEntry = namedtuple('DatasetEntry', ['frame', 'flags', 'signature'])
+
+
+def _parse(path):
+    if is_bulk_file(path):
+        with timed('eurostat_read'):
+            return read_bulk(path)
+    with timed('excel_read'):
+        raw = pd.read_excel(path)
+    with timed('clean'):
+        return clean_workbook(raw)
+
+
+def file_variant(path):
+    """How a data file is read beyond its content: the configured filters for a bulk file, '' for a workbook"""
+    return bulk_filter() if is_bulk_file(path) else ''
+
+
+def clean_file(path, cache_dir=None):
+    """Parse and clean one workbook or Eurostat bulk file, going through the disk cache"""
+    return disk_cache.load_or_build(path, lambda: _parse(path), cache_dir, file_variant(path))
+
+
+def _write_cache_entry(path, cache_dir):
+    # Runs in a worker process: the cleaned blocks travel back through the disk cache
+    clean_file(path, cache_dir)
+
+
+# Data files as served, {absolute path: signature}; while a data manager runs,
+# changes on disk stay invisible until it has rebuilt what depends on them
+_published = None
+# The next snapshot, seen only by the data manager while it builds it
+_building = contextvars.ContextVar('building', default=None)
+
+
+def _snapshot():
+    snapshot = _building.get()
+    return _published if snapshot is None else snapshot
+
+
+def disk_signature(path):
+    """Return the (mtime, size) pair of a data file as it is on disk now"""
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def file_signature(path):
+    """Return the (mtime, size) pair used to detect changes to a data file, as of the current snapshot"""
+    snapshot = _snapshot()
+    if snapshot is not None:
+        signature = snapshot.get(os.path.abspath(path))
+        if signature is not None:
+            return signature
+    return disk_signature(path)
+
+
+def snapshot_names(data_dir):
+    """File names of a data directory in the current snapshot, or None to list the directory"""
+    snapshot = _snapshot()
+    if snapshot is None:
+        return None
+    data_dir = os.path.abspath(data_dir)
+    names = sorted(os.path.basename(path) for path in snapshot if os.path.dirname(path) == data_dir)
+    return names or None
+
+
+@contextlib.contextmanager
+def building(snapshot):
+    """See the data files as in snapshot, in this context only, while the next version is built"""
+    token = _building.set(snapshot)
+    try:
+        yield
+    finally:
+        _building.reset(token)
+
+
+def publish(snapshot):
+    """Serve the data files as in snapshot from now on (None follows the disk again)"""
+    global _published
+    _published = snapshot
+
+
+def versions_kept():
+    """Versions a cache holds per dataset: the served one and, while a data manager runs, the next"""
+    return 1 if _published is None else 2
+
+
+def keep_version(versions, version, value):
+    """Add a version to an ordered {version: value} dict, dropping the oldest beyond versions_kept()"""
+    versions[version] = value
+    versions.move_to_end(version)
+    while len(versions) > versions_kept():
+        versions.popitem(last=False)
+    return value
+
+
+def dataset_version(paths):
+    """Return a version string and last-modified time for a set of data files"""
+    signatures = [(os.path.abspath(path),) + file_signature(path) for path in paths]
+    version = hashlib.sha256(repr(signatures).encode()).hexdigest()[:16]
+    last_modified = max(mtime_ns for _, mtime_ns, _ in signatures) / 1e9
+    return version, datetime.fromtimestamp(last_modified, tz=timezone.utc)
+
+
+class DatasetStore:
+    """Thread-safe, process-wide registry of cleaned workbooks"""
+
+    def __init__(self):
+        # Absolute path -> {signature: entry}
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def entry(self, path):
+        """Return the cleaned entry for a workbook, loading it only if the file changed"""
+        key = os.path.abspath(path)
+        signature = file_signature(path)
+
+        entry = self._entries.get(key, {}).get(signature)
+        cache_lookup('dataset', entry is not None)
+        if entry is None:
+            # Only one thread parses a given workbook; the others wait and reuse it
+            with self._key_lock(key):
+                entry = self._entries.get(key, {}).get(signature)
+                if entry is None:
+                    cleaned = clean_file(path)
+                    entry = DatasetEntry(cleaned.frame, cleaned.flags, signature)
+                    with self._lock:
+                        keep_version(self._entries.setdefault(key, OrderedDict()), signature, entry)
+        return entry
+
+    def stale(self, path):
+        """Whether a workbook has to be (re)loaded before it can be served"""
+        return file_signature(path) not in self._entries.get(os.path.abspath(path), {})
+
+    def prefetch(self, paths):
+        """Load every stale workbook of paths concurrently with the configured executor"""
+        paths = [path for path in dict.fromkeys(paths) if self.stale(path)]
+        if len(paths) > 1 and execution_mode() == 'process' and config.CACHE_DIR:
+            # Workers parse and write the columnar cache; this process then memory-maps it
+            with timed('prefetch'):
+                parallel_map(functools.partial(_write_cache_entry, cache_dir=config.CACHE_DIR), paths)
+        parallel_map(self.entry, paths, processes=False)
+
+    def get(self, path):
+        """Return the cleaned frame for a workbook"""
+        # Shallow copy: callers may add or replace columns without touching the shared entry
+        return self.entry(path).frame.copy(deep=False)
+
+    def flags(self, path):
+        """Return the read-only per-cell Eurostat flag mask for a workbook"""
+        return self.entry(path).flags
+
+    def prune(self):
+        """Drop the versions of every workbook that are no longer served"""
+        with self._lock:
+            for key, versions in list(self._entries.items()):
+                try:
+                    signature = file_signature(key)
+                except FileNotFoundError:
+                    signature = None
+                for stale in [s for s in versions if s != signature]:
+                    del versions[stale]
+                if not versions:
+                    del self._entries[key]
+
+    def clear(self):
+        """Drop every cached dataset"""
+        with self._lock:
+            self._entries.clear()
+
+
+store = DatasetStore()
+
+
+def prefetch(paths):
+    """Load a set of workbooks into the shared store concurrently"""
+    store.prefetch(paths)
+
+
+def load_dataset(path):
+    """Load a cleaned workbook through the shared process-wide store"""
+    return store.get(path)
+
+
+def load_flags(path):
+    """Load the quality flags of a cleaned workbook, aligned with its rows and columns"""
+    return store.flags(path)
@@ -0,0 +1,120 @@
+# all_analysis/disk_cache.py
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from all_analysis import config
+from all_analysis.cleaning import CleanedDataset
+from all_analysis.metrics import cache_lookup, timed
+
+# Bump when the on-disk layout or the cleaning rules change so stale entries are ignored
+CACHE_FORMAT = 2
+
+
+def content_hash(path):
+    """Return the SHA-256 digest of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_key(path, variant=''):
+    """Build the cache key for a cleaned workbook, or for one variant of how it was read"""
+    raw = f'{CACHE_FORMAT}:{content_hash(path)}' + (f':{variant}' if variant else '')
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return f'{stem}-{hashlib.sha256(raw.encode()).hexdigest()[:20]}'
+
+
+def _to_json_value(value):
+    if isinstance(value, (float, np.floating)) and np.isnan(value):
+        return None
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _from_json_value(value):
+    return np.nan if value is None else value
+
+
+def _atomic_write(path, write):
+    # Write to a temporary file first so concurrent workers never see a partial entry
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def write_dataset(cache_dir, key, dataset):
+    """Store a cleaned dataset as .npy value and flag blocks plus a JSON metadata file"""
+    os.makedirs(cache_dir, exist_ok=True)
+    df = dataset.frame
+    numeric_cols = df.select_dtypes(include=[np.number]).columns
+    values = df[numeric_cols].to_numpy(dtype=float)
+
+    meta = {
+        'format': CACHE_FORMAT,
+        'columns': [_to_json_value(col) for col in df.columns],
+        'numeric_columns': [_to_json_value(col) for col in numeric_cols],
+        'index': [_to_json_value(i) for i in df.index],
+        'object_columns': {
+            str(position): [_to_json_value(v) for v in df[col].tolist()]
+            for position, col in enumerate(df.columns) if col not in numeric_cols
+        },
+    }
+
+    # The blocks go first: a metadata file is only ever visible next to its data
+    _atomic_write(os.path.join(cache_dir, f'{key}.npy'), lambda f: np.save(f, values))
+    _atomic_write(os.path.join(cache_dir, f'{key}.flags.npy'), lambda f: np.save(f, dataset.flags))
+    _atomic_write(os.path.join(cache_dir, f'{key}.json'), lambda f: f.write(json.dumps(meta).encode()))
+
+
+def read_dataset(cache_dir, key):
+    """Load a cached dataset with its blocks memory-mapped, or return None"""
+    meta_path = os.path.join(cache_dir, f'{key}.json')
+    try:
+        with open(meta_path, 'rb') as f:
+            meta = json.loads(f.read())
+        values = np.load(os.path.join(cache_dir, f'{key}.npy'), mmap_mode='r')
+        flags = np.load(os.path.join(cache_dir, f'{key}.flags.npy'), mmap_mode='r')
+    except (OSError, ValueError):
+        return None
+    if meta.get('format') != CACHE_FORMAT:
+        return None
+
+    frame = pd.DataFrame(values, index=pd.Index(meta['index']),
+                         columns=pd.Index(meta['numeric_columns'], dtype=object), copy=False)
+    for position, col in enumerate(meta['columns']):
+        if str(position) in meta['object_columns']:
+            column = [_from_json_value(v) for v in meta['object_columns'][str(position)]]
+            frame.insert(position, col, np.array(column, dtype=object))
+    return CleanedDataset(frame, flags)
+
+
+def load_or_build(path, build, cache_dir=None, variant=''):
+    """Return the cleaned dataset for a workbook from the disk cache, building it on a miss"""
+    cache_dir = config.CACHE_DIR if cache_dir is None else cache_dir
+    if not cache_dir:
+        return build()
+
+    key = cache_key(path, variant)
+    with timed('disk_cache_read'):
+        dataset = read_dataset(cache_dir, key)
+    cache_lookup('disk', dataset is not None)
+    if dataset is None:
+        dataset = build()
+        try:
+            write_dataset(cache_dir, key, dataset)
+        except OSError as e:
+            print(f"Could not write cache entry for {path}: {e}")
+    return dataset
@@ -0,0 +1,5 @@
+# all_analysis/errors.py
+
+
+class QueryError(ValueError):
+    """Raised for query parameters that do not match the data"""
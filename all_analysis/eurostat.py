@@ -0,0 +1,180 @@
+# all_analysis/eurostat.py
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from all_analysis import config
+from all_analysis.cleaning import CleanedDataset, parse_values
+
+# Eurostat bulk downloads of the tourism tables, e.g. tour_occ_nim.tsv.gz (TSV) or
+# estat_tour_occ_nim.csv.gz (SDMX-CSV), optionally gzipped
+BULK_PATTERN = re.compile(r'^(?:estat_)?tour_occ_[a-z0-9_]+\.(?P<format>tsv|csv)(?:\.gz)?$')
+
+# Bump when what read_bulk keeps of the same file and filters changes, so earlier cache entries are ignored
+BULK_READER = 2
+
+# Country of residence of the guests (c_resid) -> origin
+RESIDENCE = {'TOTAL': 'total', 'DOM': 'domestic', 'FOR': 'foreign'}
+
+# NUTS codes are the two-letter country code plus one character per level
+NUTS_CODE = re.compile(r'^[A-Z]{2}[A-Z0-9]{0,3}$')
+
+# Country groups that can pass for NUTS codes (EU28, EA19, EA20, EFTA, EEA30, ...); no country code starts so
+AGGREGATE_CODE = re.compile(r'^(?:EU|EA|EEA|EFTA)')
+
+
+def is_bulk_file(path):
+    """Whether a data file is a Eurostat bulk download rather than a workbook"""
+    return BULK_PATTERN.match(os.path.basename(path)) is not None
+
+
+def nuts_level(codes):
+    """NUTS level of each region code, -1 for aggregates such as EU27_2020, EU28 or EFTA"""
+    codes = pd.Series(codes, dtype=object).astype(str)
+    regional = codes.str.match(NUTS_CODE) & ~codes.str.match(AGGREGATE_CODE)
+    return np.where(regional, codes.str.len() - 2, -1)
+
+
+def parse_years(text):
+    """(first, last) year of a filter such as '2019-2023' or '2023', None for every year"""
+    if not text:
+        return None
+    low, _, high = text.partition('-')
+    return int(low), int(high or low)
+
+
+def bulk_filter():
+    """The configured filters, which are part of the cache key of every bulk file"""
+    return (f'reader={BULK_READER};levels={",".join(map(str, config.EUROSTAT_LEVELS))};unit={config.EUROSTAT_UNIT};'
+            f'nace={config.EUROSTAT_NACE};freq=M;years={config.EUROSTAT_YEARS}')
+
+
+class _Selection:
+    """Rows and periods of a bulk file to keep, accumulated chunk by chunk as the ids and values of kept cells"""
+
+    def __init__(self):
+        self.levels = set(config.EUROSTAT_LEVELS)
+        self.years = parse_years(config.EUROSTAT_YEARS)
+        # Dimension -> the only code kept; dimensions a table does not have are ignored
+        self.wanted = {'freq': 'M', 'unit': config.EUROSTAT_UNIT, 'nace_r2': config.EUROSTAT_NACE}
+        # (origin, geo) -> row and period label -> column of the dataset being built
+        self.row_ids = {}
+        self.period_ids = {}
+        self.parts = []
+
+    def rows(self, keys):
+        """Mask of the series (a frame of dimension codes) to keep"""
+        keep = np.ones(len(keys), dtype=bool)
+        for dimension, code in self.wanted.items():
+            if dimension in keys:
+                keep &= (keys[dimension] == code).to_numpy()
+        keep &= keys['c_resid'].isin(RESIDENCE).to_numpy() if 'c_resid' in keys else True
+        keep &= np.isin(nuts_level(keys['geo']), list(self.levels))
+        return keep
+
+    def period(self, periods):
+        """Mask of the period labels (2023-01 or 2023M01) inside the year filter"""
+        if self.years is None:
+            return np.ones(len(periods), dtype=bool)
+        years = pd.to_numeric(pd.Series(periods, dtype=object).astype(str).str[:4], errors='coerce').to_numpy()
+        return (years >= self.years[0]) & (years <= self.years[1])
+
+    def _ids(self, ids, keys):
+        # Stable id of each key, numbered in order of first appearance across chunks
+        codes, uniques = pd.factorize(keys)
+        return np.array([ids.setdefault(key, len(ids)) for key in uniques], dtype=np.int32)[codes]
+
+    def add(self, origins, geos, periods, cells):
+        """Parse the raw cells of a chunk (value and flags as text) and keep those that hold a value
+
+        origins and geos label the rows of cells and periods its columns;
+        only the ids of the kept cells are held, not their labels.
+        """
+        # Eurostat pads every cell ("123 ", "456 p"), which would keep them all off the numeric fast path
+        values, flags = parse_values(pd.Series(np.asarray(cells, dtype=object).ravel()).str.strip().to_numpy())
+        present = ~np.isnan(values)
+        if not present.any():
+            return
+        rows = self._ids(self.row_ids, pd.MultiIndex.from_arrays([origins, geos]))
+        columns = self._ids(self.period_ids, pd.Index(periods, dtype=object))
+        if np.ndim(cells) == 2:
+            rows, columns = np.repeat(rows, len(columns)), np.tile(columns, len(rows))
+        self.parts.append((rows[present], columns[present], values[present], flags[present]))
+
+    def dataset(self):
+        """One row per origin and region, one column per period, as cleaned workbooks have"""
+        block = np.full((len(self.row_ids), len(self.period_ids)), np.nan)
+        block_flags = np.zeros(block.shape, dtype=np.uint16)
+        for rows, columns, values, flags in self.parts:
+            # Later chunks win over earlier ones holding the same observation
+            block[rows, columns] = values
+            block_flags[rows, columns] = flags
+
+        # Periods in calendar order; rows and periods without any kept value are dropped
+        labels = np.array(list(self.period_ids), dtype=object)
+        missing = np.isnan(block)
+        keep = ~missing.all(axis=1)
+        order = np.argsort(labels.astype(str), kind='stable')
+        order = order[~missing.all(axis=0)[order]]
+        block, block_flags = block[keep][:, order], block_flags[keep][:, order]
+        block.flags.writeable = False
+        block_flags.flags.writeable = False
+
+        # Rows are indexed by origin; the label column holds the region code
+        keys = [key for key, kept in zip(self.row_ids, keep) if kept]
+        frame = pd.DataFrame(block, index=pd.Index([origin for origin, _ in keys], dtype=object),
+                             columns=pd.Index(labels[order], dtype=object), copy=False)
+        frame.insert(0, 'GEO', np.array([geo for _, geo in keys], dtype=object))
+        return CleanedDataset(frame, block_flags)
+
+
+def _read_tsv(path, selection):
+    # Series are rows ("freq,c_resid,unit,nace_r2,geo\TIME_PERIOD", then one column per period)
+    header = pd.read_csv(path, sep='\t', nrows=0).columns
+    key_column = header[0]
+    dimensions = key_column.split('\\')[0].split(',')
+    periods = [column for column in header[1:] if selection.period([column.strip()])[0]]
+    for chunk in pd.read_csv(path, sep='\t', usecols=[key_column] + periods, dtype=str,
+                             chunksize=config.EUROSTAT_CHUNK_ROWS, keep_default_na=False):
+        keys = chunk[key_column].str.split(',', expand=True)
+        keys.columns = dimensions
+        keep = selection.rows(keys)
+        if not keep.any():
+            continue
+        origins = keys.loc[keep, 'c_resid'].map(RESIDENCE) if 'c_resid' in keys else 'total'
+        selection.add(np.broadcast_to(np.asarray(origins, dtype=object), keep.sum()),
+                      keys.loc[keep, 'geo'].to_numpy(), [period.strip() for period in periods],
+                      chunk.loc[keep, periods].to_numpy(dtype=object))
+
+
+def _read_sdmx_csv(path, selection):
+    # One observation per row, with the dimensions, TIME_PERIOD, OBS_VALUE and OBS_FLAG as columns
+    header = pd.read_csv(path, nrows=0).columns
+    columns = [c for c in header if c in selection.wanted or c in ('c_resid', 'geo', 'TIME_PERIOD', 'OBS_VALUE', 'OBS_FLAG')]
+    for chunk in pd.read_csv(path, usecols=columns, dtype=str, chunksize=config.EUROSTAT_CHUNK_ROWS,
+                             keep_default_na=False):
+        keep = selection.rows(chunk) & selection.period(chunk['TIME_PERIOD'].to_numpy())
+        if not keep.any():
+            continue
+        chunk = chunk[keep]
+        origins = chunk['c_resid'].map(RESIDENCE) if 'c_resid' in chunk else 'total'
+        flags = chunk['OBS_FLAG'] if 'OBS_FLAG' in chunk else ''
+        # Long rows: one cell per observation, labelled by its own row and period
+        selection.add(np.broadcast_to(np.asarray(origins, dtype=object), len(chunk)), chunk['geo'].to_numpy(),
+                      chunk['TIME_PERIOD'].to_numpy(), (chunk['OBS_VALUE'] + ' ' + flags).to_numpy())
+
+
+def read_bulk(path):
+    """Stream a Eurostat bulk file in chunks, keeping only the configured levels, unit, activity and years
+
+    Only the kept observations are held in memory, however large the file;
+    the result is a cleaned dataset with one row per origin and region.
+    """
+    selection = _Selection()
+    if BULK_PATTERN.match(os.path.basename(path))['format'] == 'tsv':
+        _read_tsv(path, selection)
+    else:
+        _read_sdmx_csv(path, selection)
+    return selection.dataset()
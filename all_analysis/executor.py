@@ -0,0 +1,56 @@
+# all_analysis/executor.py
+import contextvars
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from all_analysis import config
+
+EXECUTION_MODES = ('serial', 'thread', 'process')
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def execution_mode(mode=None):
+    """Validate an execution mode, defaulting to the configured one"""
+    mode = mode or config.EXECUTION_MODE
+    if mode not in EXECUTION_MODES:
+        raise ValueError(f"Unknown execution mode {mode!r}, expected one of {', '.join(EXECUTION_MODES)}")
+    return mode
+
+
+def _pool(mode):
+    # One long-lived pool per mode so workers are started once per process
+    with _pools_lock:
+        pool = _pools.get(mode)
+        if pool is None:
+            pool_class = ProcessPoolExecutor if mode == 'process' else ThreadPoolExecutor
+            pool = _pools[mode] = pool_class(max_workers=config.MAX_WORKERS)
+        return pool
+
+
+def parallel_map(func, items, mode=None, processes=True):
+    """Apply func to every item with the configured executor and return the results in order
+
+    With processes=False, work that cannot leave this process (e.g. it needs
+    the caller's locks or memoized state) runs on threads in process mode.
+    """
+    items = list(items)
+    mode = execution_mode(mode)
+    if mode == 'process' and not processes:
+        mode = 'thread'
+    if mode == 'serial' or len(items) < 2:
+        return [func(item) for item in items]
+    if mode == 'thread':
+        # Threads see the caller's context: its request trace and the data snapshot it reads
+        context = contextvars.copy_context()
+        return list(_pool(mode).map(lambda item: context.copy().run(func, item), items))
+    return list(_pool(mode).map(func, items))
+
+
+def shutdown():
+    """Stop every worker pool"""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.shutdown()
+        _pools.clear()
@@ -0,0 +1,205 @@
+# all_analysis/figures.py
+import base64
+import functools
+import json
+
+import numpy as np
+import plotly
+import plotly.graph_objects as go
+import plotly.io as pio
+
+from all_analysis import config
+from all_analysis.config import PLOT_BACKENDS
+from all_analysis.metrics import timed
+from all_analysis.reduction import reduce_figure
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Plot backends (config.PLOT_BACKENDS):
+# orjson: plain specs through orjson (NumPy arrays written natively)
+# json: plain specs through PlotlyJSONEncoder, no figure objects
+# plotly: validated go.Figure objects, the reference output
+
+# Templates a page sends once for all its figures instead of inside every figure
+SHARED_TEMPLATES = ('plotly_white',)
+
+# Nested properties that take magic-underscore shorthands such as xaxis_title or marker_color
+COMPOUND_PROPERTIES = ('xaxis', 'yaxis', 'marker', 'line', 'legend', 'font', 'title')
+
+# NumPy dtypes plotly.js (2.28+) decodes from base64 typed arrays
+TYPED_ARRAY_DTYPES = {
+    np.dtype('float64'): 'f8', np.dtype('float32'): 'f4',
+    np.dtype('int32'): 'i4', np.dtype('int16'): 'i2', np.dtype('int8'): 'i1',
+    np.dtype('uint32'): 'u4', np.dtype('uint16'): 'u2', np.dtype('uint8'): 'u1',
+}
+
+
+def _expand(props):
+    """Expand magic underscores and string titles the way plotly's constructors do"""
+    spec = {}
+    for key, value in props.items():
+        head, _, rest = key.partition('_')
+        if rest and head in COMPOUND_PROPERTIES:
+            key, value = head, _expand({rest: value})
+        if isinstance(value, dict):
+            value = _expand(value)
+        elif isinstance(value, list) and any(isinstance(item, dict) for item in value):
+            value = [_expand(item) if isinstance(item, dict) else item for item in value]
+        if key == 'title' and isinstance(value, str):
+            value = {'text': value}
+        if isinstance(value, dict) and isinstance(spec.get(key), dict):
+            value = {**spec[key], **value}
+        spec[key] = value
+    return spec
+
+
+@functools.lru_cache(maxsize=None)
+def template(name):
+    """The layout template plotly embeds for a named template"""
+    return pio.templates[name].to_plotly_json()
+
+
+def trace(kind, **props):
+    """Plain-dict trace spec, e.g. trace('bar', x=..., y=..., marker_color='#1f77b4')"""
+    return {**_expand(props), 'type': kind}
+
+
+def figure(*traces, **layout):
+    """Plain-dict figure spec from traces and layout properties, as update_layout() takes them
+
+    A named template stays a name until the figure is serialized (see figure_json).
+    """
+    return {'data': list(traces), 'layout': _expand(layout)}
+
+
+def _with_template(fig, shared):
+    # Inline a named template, or leave it to the page (layout.meta.template) when it is shared
+    name = fig['layout'].get('template')
+    if not isinstance(name, str):
+        return fig
+    layout = dict(fig['layout'])
+    if name in shared:
+        del layout['template']
+        layout['meta'] = {**layout.get('meta', {}), 'template': name}
+    else:
+        layout['template'] = template(name)
+    return {**fig, 'layout': layout}
+
+
+def shared_templates():
+    """The templates figures leave out when config.PLOT_SHARED_TEMPLATES is on, by name, for the page to supply"""
+    return {name: template(name) for name in SHARED_TEMPLATES}
+
+
+def _round_floats(value, decimals):
+    # Float arrays and scalars rounded to a number of decimals; everything else is left as is
+    if isinstance(value, dict):
+        return {key: _round_floats(item, decimals) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_round_floats(item, decimals) for item in value]
+    if getattr(value, 'ndim', 0) >= 1 and value.dtype.kind == 'f':
+        # NumPy arrays and pandas Series or Index
+        return np.round(np.asarray(value), decimals)
+    if isinstance(value, (float, np.floating)):
+        return float(np.round(value, decimals))
+    return value
+
+
+def _typed_arrays(value, min_length):
+    # Long numeric arrays become {dtype, bdata}; everything else is left as is
+    if isinstance(value, dict):
+        return {key: _typed_arrays(item, min_length) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_typed_arrays(item, min_length) for item in value]
+    if isinstance(value, np.ndarray) and value.dtype in TYPED_ARRAY_DTYPES and value.ndim == 1 \
+            and len(value) >= min_length:
+        data = np.ascontiguousarray(value, dtype=value.dtype.newbyteorder('<'))
+        return {'dtype': TYPED_ARRAY_DTYPES[value.dtype], 'bdata': base64.b64encode(data.tobytes()).decode('ascii')}
+    return value
+
+
+def _orjson_default(value):
+    # Arrays orjson cannot write natively (object dtype, non-contiguous) and pandas objects
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    raise TypeError(f'Cannot serialize {type(value).__name__}')
+
+
+def plot_backend(backend=None):
+    """Resolve a plot backend, defaulting to the configured one; orjson falls back to json when missing"""
+    backend = backend or config.PLOT_BACKEND
+    if backend not in PLOT_BACKENDS:
+        raise ValueError(f"Unknown plot backend {backend!r}, expected one of {', '.join(PLOT_BACKENDS)}")
+    if backend == 'orjson' and orjson is None:
+        return 'json'
+    return backend
+
+
+def figure_json(fig, backend=None, typed_array_min=None, float_decimals=None, shared=None):
+    """Serialize a figure spec (or a go.Figure) for the browser
+
+    Floats are rounded to float_decimals (negative keeps them exact) and the
+    templates in shared are left for the page to supply; both default to config.
+    """
+    backend = plot_backend(backend)
+    typed_array_min = config.PLOT_TYPED_ARRAY_MIN if typed_array_min is None else typed_array_min
+    float_decimals = config.PLOT_FLOAT_DECIMALS if float_decimals is None else float_decimals
+    if shared is None:
+        shared = SHARED_TEMPLATES if config.PLOT_SHARED_TEMPLATES else ()
+    with timed('json_encode'):
+        if backend == 'plotly' or isinstance(fig, go.Figure):
+            return json.dumps(go.Figure(fig), cls=plotly.utils.PlotlyJSONEncoder)
+        if float_decimals >= 0:
+            # Before the template is inlined: templates are sent exactly as plotly defines them
+            fig = _round_floats(fig, float_decimals)
+        fig = _with_template(fig, shared)
+        if typed_array_min:
+            fig = _typed_arrays(fig, typed_array_min)
+        if backend == 'orjson':
+            return orjson.dumps(fig, default=_orjson_default, option=orjson.OPT_SERIALIZE_NUMPY).decode('utf-8')
+        return json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder)
+
+
+def plot_json(fig, window=None, lod=True):
+    """Reduce a figure spec to a bounded size and serialize it"""
+    return figure_json(reduce_figure(fig, window, lod=lod))
+
+
+def _decode_typed_arrays(value):
+    if isinstance(value, dict):
+        if set(value) == {'dtype', 'bdata'}:
+            dtype = np.dtype({code: dtype for dtype, code in TYPED_ARRAY_DTYPES.items()}[value['dtype']])
+            decoded = np.frombuffer(base64.b64decode(value['bdata']), dtype=dtype.newbyteorder('<'))
+            return [None if np.isnan(v) else v for v in decoded.astype(float).tolist()]
+        return {key: _decode_typed_arrays(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_decode_typed_arrays(item) for item in value]
+    return value
+
+
+def equivalent(fig, backend=None, typed_array_min=None):
+    """Whether a spec serializes to the same figure as the validated plotly path
+
+    Shared templates are put back and the reference is rounded like the fast
+    output, so only differences in serialization remain.
+    """
+    fast = _decode_typed_arrays(json.loads(figure_json(fig, backend, typed_array_min)))
+    reference = json.loads(figure_json(fig, 'plotly'))
+    template_name = fast['layout'].get('meta', {}).pop('template', None)
+    if template_name is not None:
+        fast['layout']['template'] = json.loads(json.dumps(shared_templates()[template_name]))
+        if not fast['layout']['meta']:
+            del fast['layout']['meta']
+    if config.PLOT_FLOAT_DECIMALS >= 0 and plot_backend(backend) != 'plotly':
+        reference_template = reference['layout'].pop('template', None)
+        reference = _round_floats(reference, config.PLOT_FLOAT_DECIMALS)
+        if reference_template is not None:
+            reference['layout']['template'] = reference_template
+    return fast == reference
@@ -0,0 +1,118 @@
+# all_analysis/growth.py
+import numpy as np
+
+# Per region, period and origin metrics of a Growth, in column order
+GROWTH_METRICS = ('mom', 'yoy', 'ytd', 'ytd_yoy', 'recovery')
+
+
+def timeline(years, values):
+    """Lay a region × year × month × origin array out as region × period × origin over consecutive years
+
+    Years missing between the first and the last are filled with NaN, so
+    the period of the same month a year earlier is always 12 periods back.
+    """
+    span = years[-1] - years[0] + 1
+    full = np.full((values.shape[0], span, 12, values.shape[3]), np.nan)
+    full[:, np.asarray(years) - years[0]] = values
+    return full.reshape(values.shape[0], span * 12, values.shape[3])
+
+
+def _lagged(series, lag, start):
+    # series[:, t - lag] for every period t from start, NaN before the first period
+    head = min(max(lag - start, 0), series.shape[1] - start)
+    lagged = np.full((series.shape[0], series.shape[1] - start) + series.shape[2:], np.nan)
+    lagged[:, head:] = series[:, start + head - lag:series.shape[1] - lag]
+    return lagged
+
+
+def _changed_from(old, new):
+    """First period at which two region × period × origin arrays differ, the end of the shorter when they never do"""
+    periods = min(old.shape[1], new.shape[1])
+    # Compared bit for bit, so missing values match without a NaN mask; a NaN that
+    # merely changed payload counts as changed, which only recomputes more
+    differs = (old[:, :periods].view(np.int64) != new[:, :periods].view(np.int64)).any(axis=(0, 2))
+    changed = np.flatnonzero(differs)
+    return changed[0] if len(changed) else periods
+
+
+class Growth:
+    """Growth metrics of every region, period and origin of a region × period × origin timeline
+
+    - mom: change on the previous month (0.05 is +5%)
+    - yoy: change on the same month a year earlier
+    - ytd: total from January to the month, over the months that have data
+    - ytd_yoy: change of ytd on the same month a year earlier
+    - recovery: the month as a percentage of the same month of the baseline year
+
+    Every metric of a period looks back, never forward, so when later data
+    changes only the periods from the first changed one need recomputing
+    (see update).
+    """
+
+    def __init__(self, regions, first_year, values, baseline_year, metrics=None, start=0):
+        self.regions = regions
+        self.first_year = first_year
+        self.values = values
+        self.baseline_year = baseline_year
+        if metrics is None:
+            metrics = {name: np.empty(values.shape) for name in GROWTH_METRICS}
+        self.metrics = metrics
+        # First period this Growth computed; earlier ones were copied from the one it updates
+        self.computed_from = start
+        if start < values.shape[1]:
+            self._compute(start)
+
+    @classmethod
+    def from_arrays(cls, regions, first_year, baseline_year, arrays):
+        """A Growth over arrays computed before (see arrays), e.g. mapped from a published copy"""
+        metrics = {name: arrays[name] for name in GROWTH_METRICS}
+        # Starting past the last period computes nothing, so read-only arrays can be used as they are
+        return cls(regions, first_year, arrays['values'], baseline_year, metrics, arrays['values'].shape[1])
+
+    def arrays(self):
+        """The timeline and every metric by name, as from_arrays takes them"""
+        return {'values': self.values, **self.metrics}
+
+    def _compute(self, start):
+        # Recompute every metric for the periods from start on, reading earlier periods as they are
+        values = self.values
+        tail = values[:, start:]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.metrics['mom'][:, start:] = tail / _lagged(values, 1, start) - 1
+            self.metrics['yoy'][:, start:] = tail / _lagged(values, 12, start) - 1
+
+            # Cumulative sums restart every January, so the tail starts at the year of start
+            year_start = start - start % 12
+            block = values[:, year_start:].reshape(values.shape[0], -1, 12, values.shape[2])
+            ytd = np.nancumsum(block, axis=2).reshape(values.shape[0], -1, values.shape[2])
+            self.metrics['ytd'][:, start:] = np.where(np.isnan(tail), np.nan, ytd[:, start - year_start:])
+            self.metrics['ytd_yoy'][:, start:] = self.metrics['ytd'][:, start:] / _lagged(self.metrics['ytd'], 12, start) - 1
+
+            # Recovery reads the baseline year, so a change up to its end recomputes all of it
+            b = (self.baseline_year - self.first_year) * 12
+            if 0 <= b < values.shape[1]:
+                first = 0 if start < b + 12 else start
+                months = np.arange(first, values.shape[1]) % 12
+                self.metrics['recovery'][:, first:] = values[:, first:] / values[:, b + months] * 100
+            else:
+                self.metrics['recovery'][:, start:] = np.nan
+
+    def update(self, regions, first_year, values, baseline_year):
+        """The Growth of a new version of the timeline, recomputing only the periods that changed
+
+        Periods before the first changed one are copied from this Growth,
+        which is left untouched for whoever still serves it. A change of
+        regions, first year or baseline recomputes everything.
+        """
+        if (not regions.equals(self.regions) or first_year != self.first_year
+                or baseline_year != self.baseline_year or values.shape[1] < self.values.shape[1]):
+            return Growth(regions, first_year, values, baseline_year)
+        start = _changed_from(self.values, values)
+        if start == values.shape[1] == self.values.shape[1]:
+            return self
+
+        metrics = {}
+        for name, array in self.metrics.items():
+            metrics[name] = np.empty(values.shape)
+            metrics[name][:, :start] = array[:, :start]
+        return Growth(regions, first_year, values, baseline_year, metrics, start)
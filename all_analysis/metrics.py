@@ -0,0 +1,148 @@
+# all_analysis/metrics.py
+import contextlib
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+
+# Upper bounds, in seconds, of the latency histogram buckets
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Every metric the application records: name -> (type, help)
+METRICS = {
+    'tourism_request_seconds': ('histogram', 'Time to answer an HTTP request'),
+    'tourism_stage_seconds': ('histogram', 'Time spent in one processing stage'),
+    'tourism_cache_requests_total': ('counter', 'Cache lookups by cache and result'),
+    'tourism_dataset_rows': ('gauge', 'Observations held per NUTS level and origin'),
+    'tourism_dataset_bytes': ('gauge', 'Memory held per NUTS level and origin'),
+    'tourism_response_cache_bytes': ('gauge', 'Bytes held by the response cache'),
+    'tourism_startup_seconds': ('gauge', 'Time from the start of the app import until it was ready to serve'),
+    'tourism_data_reloads_total': ('counter', 'Hot reloads of changed data files by result'),
+    'tourism_single_flight_total': ('counter', 'Coalesced calls by role: leader ran it, waiter shared its result, timeout gave up, background refreshed'),
+    'tourism_import_seconds': ('gauge', 'Time taken by the first import of a lazily loaded module'),
+}
+
+# Stages timed during the current request, for the Server-Timing header
+_trace = contextvars.ContextVar('trace', default=None)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels_text(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+
+class Registry:
+    """In-process counters, gauges and histograms rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, name, labels):
+        if name not in METRICS:
+            raise KeyError(f'Unknown metric {name!r}')
+        return name, tuple(sorted(labels.items()))
+
+    def increment(self, name, amount=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._values[key] = value
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            # Per-bucket counts followed by the sum and the count of observations
+            histogram = self._values.get(key)
+            if histogram is None:
+                histogram = self._values[key] = [0] * (len(BUCKETS) + 1) + [0.0, 0]
+            histogram[bisect_left(BUCKETS, value)] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def value(self, name, **labels):
+        """Current value of a counter or gauge, or (sum, count) of a histogram"""
+        value = self._values.get(self._key(name, labels))
+        if METRICS[name][0] == 'histogram':
+            return (0.0, 0) if value is None else (value[-2], value[-1])
+        return value or 0
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self):
+        """Every metric in the Prometheus text exposition format"""
+        with self._lock:
+            values = {key: list(value) if isinstance(value, list) else value
+                      for key, value in self._values.items()}
+        lines = []
+        for name, (kind, help_text) in METRICS.items():
+            series = sorted((labels, value) for (metric, labels), value in values.items() if metric == name)
+            if not series:
+                continue
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in series:
+                if kind != 'histogram':
+                    lines.append(f'{name}{_labels_text(labels)} {value}')
+                    continue
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ('+Inf',), value):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_labels_text(labels, [("le", bound)])} {cumulative}')
+                lines.append(f'{name}_sum{_labels_text(labels)} {value[-2]}')
+                lines.append(f'{name}_count{_labels_text(labels)} {value[-1]}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+@contextlib.contextmanager
+def timed(stage):
+    """Record the duration of a processing stage in the stage histogram and the current trace"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        registry.observe('tourism_stage_seconds', seconds, stage=stage)
+        trace = _trace.get()
+        if trace is not None:
+            trace.append((stage, seconds))
+
+
+def cache_lookup(cache, hit):
+    """Count a hit or miss of one of the caches"""
+    registry.increment('tourism_cache_requests_total', cache=cache, result='hit' if hit else 'miss')
+
+
+def start_trace():
+    """Begin collecting stage timings for the current request"""
+    return _trace.set([])
+
+
+def end_trace(token):
+    """Stop collecting and return the (stage, seconds) pairs of the current request"""
+    trace = _trace.get() or []
+    _trace.reset(token)
+    return trace
+
+
+def server_timing(trace):
+    """Format stage timings as a Server-Timing header value, merging repeated stages"""
+    totals = {}
+    for stage, seconds in trace:
+        totals[stage] = totals.get(stage, 0.0) + seconds
+    return ', '.join(f'{stage.replace(":", "-")};dur={seconds * 1000:.2f}' for stage, seconds in totals.items())
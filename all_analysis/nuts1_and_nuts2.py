@@ -1,85 +1,86 @@
 # all_analysis/nuts1_and_nuts2.py
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-import json
-import plotly
-import numpy as np
+from all_analysis.computation import depends_on, graph_for, memoized
+from all_analysis.executor import parallel_map
+from all_analysis.figures import figure, plot_json, trace
+from all_analysis.reduction import snap_window
+from all_analysis.cube import latest_common_year, load_cube
+from all_analysis.tourism_data import series_files, series_version
+
 
 class DataAnalyzer:
-    def __init__(self):
-        self.nuts1_df = None
-        self.nuts2_df = None
+    SERIES = ((1, 'total'), (2, 'total'))
+    # Figures served by get_plot(), by name
+    PLOTS = {
+        'monthly_trend': 'create_monthly_trend_plot',
+        'regional_comparison': 'create_regional_comparison_plot',
+    }
+
+    def __init__(self, year=None):
+        self.year = year
+        self.nuts1 = None
+        self.nuts2 = None
         self.load_data()
+        self.graph = graph_for(type(self).__name__, {series: series_version(*series) for series in self.SERIES}, self.year)
+
+    @classmethod
+    def data_files(cls):
+        """Paths of every workbook this analyzer reads"""
+        return [path for level, origin in cls.SERIES for path in series_files(level, origin)]
 
     def load_data(self):
-        """Load NUTS1 and NUTS2 data from Excel files"""
+        """Load the NUTS1 and NUTS2 aggregate cubes"""
         try:
-            self.nuts1_df = pd.read_excel('data/nuts_1_2023.xlsx')
-            self.nuts2_df = pd.read_excel('data/nuts_2_2023.xlsx')
-            self.clean_data()
+            self.nuts1 = load_cube(1)
+            self.nuts2 = load_cube(2)
+            self.year = self.year or latest_common_year(self.SERIES)
         except Exception as e:
             print(f"Error loading data: {e}")
             raise
 
-    def clean_data(self):
-        """Clean the dataframes by removing ':' values and converting to numeric"""
-        def clean_df(df):
-            # Make a copy to avoid modifying the original
-            cleaned = df.copy()
-            
-            # Replace ':' with NaN
-            cleaned = cleaned.replace(':', np.nan)
-            
-            # Convert all columns except first (if it's region names) to numeric
-            numeric_cols = cleaned.columns[1:] if isinstance(cleaned.columns[0], str) else cleaned.columns
-            for col in numeric_cols:
-                cleaned[col] = pd.to_numeric(cleaned[col], errors='coerce')
-            
-            # Drop rows with all NaN values
-            cleaned = cleaned.dropna(how='all')
-            
-            return cleaned
-
-        self.nuts1_df = clean_df(self.nuts1_df)
-        self.nuts2_df = clean_df(self.nuts2_df)
+    def monthly_means(self, name):
+        """Mean of each month across regions"""
+        return getattr(self, name).monthly('mean', self.year, 'total')
+
+    def monthly_sums(self, name):
+        """Total of each month across regions"""
+        return getattr(self, name).monthly('sum', self.year, 'total')
+
+    def _analyze(self, name):
+        """Summary statistics for one NUTS level"""
+        cube = getattr(self, name)
+        monthly_means = self.monthly_means(name)
+        monthly_sums = self.monthly_sums(name)
 
+        return {
+            'total_population': cube.total('sum', self.year, 'total'),
+            'average_monthly': float(monthly_means.mean()),
+            'max_month': cube.total('max', self.year, 'total'),
+            'min_month': cube.total('min', self.year, 'total'),
+            'regional_averages': monthly_means.to_dict(),
+            'monthly_totals': monthly_sums.to_dict()
+        }
+
+    @memoized
+    @depends_on((1, 'total'))
     def analyze_nuts1(self):
         """Analyze NUTS1 data"""
-        # Calculate only valid numeric values
-        numeric_cols = self.nuts1_df.select_dtypes(include=[np.number]).columns
-        
-        analysis = {
-            'total_population': float(self.nuts1_df[numeric_cols].sum().sum()), 
-            'average_monthly': float(self.nuts1_df[numeric_cols].mean().mean()),
-            'max_month': float(self.nuts1_df[numeric_cols].max().max()),
-            'min_month': float(self.nuts1_df[numeric_cols].min().min()),
-            'regional_averages': self.nuts1_df[numeric_cols].mean().to_dict(),
-            'monthly_totals': self.nuts1_df[numeric_cols].sum().to_dict()
-        }
-        return analysis
+        return self._analyze('nuts1')
 
+    @memoized
+    @depends_on((2, 'total'))
     def analyze_nuts2(self):
         """Analyze NUTS2 data"""
-        numeric_cols = self.nuts2_df.select_dtypes(include=[np.number]).columns
-        
-        analysis = {
-            'total_population': float(self.nuts2_df[numeric_cols].sum().sum()),
-            'average_monthly': float(self.nuts2_df[numeric_cols].mean().mean()),
-            'max_month': float(self.nuts2_df[numeric_cols].max().max()),
-            'min_month': float(self.nuts2_df[numeric_cols].min().min()),
-            'regional_averages': self.nuts2_df[numeric_cols].mean().to_dict(),
-            'monthly_totals': self.nuts2_df[numeric_cols].sum().to_dict()
-        }
-        return analysis
+        return self._analyze('nuts2')
 
+    @memoized
     def create_monthly_trend_plot(self):
         """Create monthly trend visualization"""
-        fig = go.Figure()
+        traces = []
         
         # NUTS1 monthly trend
-        nuts1_monthly = self.nuts1_df.select_dtypes(include=[np.number]).mean()
-        fig.add_trace(go.Scatter(
+        nuts1_monthly = self.monthly_means('nuts1')
+        traces.append(trace(
+            'scatter',
             x=list(nuts1_monthly.index),
             y=nuts1_monthly.values,
             name='NUTS1',
@@ -87,62 +88,76 @@ class DataAnalyzer:
         ))
         
         # NUTS2 monthly trend
-        nuts2_monthly = self.nuts2_df.select_dtypes(include=[np.number]).mean()
-        fig.add_trace(go.Scatter(
+        nuts2_monthly = self.monthly_means('nuts2')
+        traces.append(trace(
+            'scatter',
             x=list(nuts2_monthly.index),
             y=nuts2_monthly.values,
             name='NUTS2',
             mode='lines+markers'
         ))
         
-        fig.update_layout(
+        return figure(
+            *traces,
             title='Monthly Accommodation Trends',
             xaxis_title='Month',
             yaxis_title='Average Population',
             template='plotly_white',
             showlegend=True
         )
-        
-        return json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder)
 
+    @memoized
     def create_regional_comparison_plot(self):
         """Create regional comparison visualization"""
-        fig = go.Figure()
+        traces = []
         
         # NUTS1 regional data
-        nuts1_regional = self.nuts1_df.select_dtypes(include=[np.number]).sum()
-        fig.add_trace(go.Bar(
+        nuts1_regional = self.monthly_sums('nuts1')
+        traces.append(trace(
+            'bar',
             name='NUTS1',
             x=nuts1_regional.index,
             y=nuts1_regional.values
         ))
         
         # NUTS2 regional data
-        nuts2_regional = self.nuts2_df.select_dtypes(include=[np.number]).sum()
-        fig.add_trace(go.Bar(
+        nuts2_regional = self.monthly_sums('nuts2')
+        traces.append(trace(
+            'bar',
             name='NUTS2',
             x=nuts2_regional.index,
             y=nuts2_regional.values
         ))
         
-        fig.update_layout(
+        return figure(
+            *traces,
             title='Regional Comparison',
             xaxis_title='Region',
             yaxis_title='Total Population',
             barmode='group',
             template='plotly_white'
         )
-        
-        return json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder)
+
+    def get_analysis(self):
+        """Get the NUTS1 and NUTS2 summaries without building any figure"""
+        return self.analyze_nuts1(), self.analyze_nuts2()
+
+    @memoized
+    def get_plot(self, name):
+        """Get the JSON of one figure from PLOTS"""
+        return plot_json(getattr(self, self.PLOTS[name])())
+
+    def get_plot_window(self, name, x0, x1):
+        """Get the JSON of one figure from PLOTS at full detail between x0 and x1"""
+        return plot_json(getattr(self, self.PLOTS[name])(), window=(x0, x1))
+
+    def plot_window(self, name, x0, x1):
+        """Snap an x range of one figure from PLOTS to the first and last x it selects"""
+        return snap_window(getattr(self, self.PLOTS[name])(), (x0, x1))
 
     def get_full_analysis(self):
         """Get complete analysis including visualizations"""
-        nuts1_analysis = self.analyze_nuts1()
-        nuts2_analysis = self.analyze_nuts2()
-        
-        plot_data = {
-            'monthly_trend': self.create_monthly_trend_plot(),
-            'regional_comparison': self.create_regional_comparison_plot()
-        }
-        
-        return nuts1_analysis, nuts2_analysis, plot_data
\ No newline at end of file
+        nuts1_analysis, nuts2_analysis = self.get_analysis()
+        # Figures are independent, so they are built concurrently
+        plot_data = dict(zip(self.PLOTS, parallel_map(self.get_plot, self.PLOTS, processes=False)))
+        return nuts1_analysis, nuts2_analysis, plot_data
@@ -1,80 +1,84 @@
 # all_analysis/nuts1_foreign_domestic.py
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-import json
-import plotly
-import numpy as np
+from all_analysis.computation import graph_for, memoized
+from all_analysis.executor import parallel_map
+from all_analysis.figures import figure, plot_json, trace
+from all_analysis.reduction import snap_window
+from all_analysis.cube import latest_common_year, load_cube
+from all_analysis.tourism_data import series_files, series_version
+
 
 class ForeignDomesticAnalyzer:
-    def __init__(self):
-        self.domestic_df = None
-        self.foreign_df = None
+    SERIES = ((1, 'domestic'), (1, 'foreign'))
+    # Figures served by get_plot(), by name
+    PLOTS = {
+        'monthly_comparison': 'create_monthly_comparison_plot',
+        'regional_distribution': 'create_regional_distribution_plot',
+        'visitor_distribution': 'create_pie_chart',
+    }
+
+    def __init__(self, year=None):
+        self.year = year
+        self.cube = None
         self.load_data()
+        self.graph = graph_for(type(self).__name__, {series: series_version(*series) for series in self.SERIES}, self.year)
+
+    @classmethod
+    def data_files(cls):
+        """Paths of every workbook this analyzer reads"""
+        return [path for level, origin in cls.SERIES for path in series_files(level, origin)]
 
     def load_data(self):
-        """Load domestic and foreign NUTS1 data"""
+        """Load the NUTS1 aggregate cube"""
         try:
-            self.domestic_df = pd.read_excel('data/nuts_1_2023_domestic.xlsx')
-            self.foreign_df = pd.read_excel('data/nuts_1_2023_foreigner.xlsx')
-            self.clean_data()
+            self.cube = load_cube(1)
+            self.year = self.year or latest_common_year(self.SERIES)
         except Exception as e:
             print(f"Error loading data: {e}")
             raise
 
-    def clean_data(self):
-        """Clean the dataframes by removing ':' values and converting to numeric"""
-        def clean_df(df):
-            cleaned = df.copy()
-            cleaned = cleaned.replace(':', np.nan)
-            
-            numeric_cols = cleaned.columns[1:] if isinstance(cleaned.columns[0], str) else cleaned.columns
-            for col in numeric_cols:
-                cleaned[col] = pd.to_numeric(cleaned[col], errors='coerce')
-            
-            cleaned = cleaned.dropna(how='all')
-            return cleaned
-
-        self.domestic_df = clean_df(self.domestic_df)
-        self.foreign_df = clean_df(self.foreign_df)
+    def monthly_means(self, origin):
+        """Mean of each month across regions"""
+        return self.cube.monthly('mean', self.year, origin)
+
+    def monthly_sums(self, origin):
+        """Total of each month across regions"""
+        return self.cube.monthly('sum', self.year, origin)
 
+    @memoized
     def analyze_data(self):
         """Analyze both domestic and foreign data"""
-        def get_analysis(df, name):
-            numeric_cols = df.select_dtypes(include=[np.number]).columns
+        def get_analysis(origin, name):
+            monthly_sums = self.monthly_sums(origin)
             return {
-                'total': float(df[numeric_cols].sum().sum()),
-                'average_monthly': float(df[numeric_cols].mean().mean()),
-                'max_month': float(df[numeric_cols].max().max()),
-                'min_month': float(df[numeric_cols].min().min()),
-                'regional_totals': df[numeric_cols].sum().to_dict(),
-                'monthly_totals': df[numeric_cols].sum(axis=0).to_dict(),
+                'total': self.cube.total('sum', self.year, origin),
+                'average_monthly': float(self.monthly_means(origin).mean()),
+                'max_month': self.cube.total('max', self.year, origin),
+                'min_month': self.cube.total('min', self.year, origin),
+                'regional_totals': monthly_sums.to_dict(),
+                'monthly_totals': monthly_sums.to_dict(),
                 'name': name
             }
 
-        domestic_analysis = get_analysis(self.domestic_df, 'Domestic')
-        foreign_analysis = get_analysis(self.foreign_df, 'Foreign')
+        domestic_analysis = get_analysis('domestic', 'Domestic')
+        foreign_analysis = get_analysis('foreign', 'Foreign')
 
         # Calculate percentage comparisons
-        total_visitors = domestic_analysis['total'] + foreign_analysis['total']
         analysis = {
             'domestic': domestic_analysis,
             'foreign': foreign_analysis,
-            'comparisons': {
-                'domestic_percentage': (domestic_analysis['total'] / total_visitors) * 100,
-                'foreign_percentage': (foreign_analysis['total'] / total_visitors) * 100,
-                'total_visitors': total_visitors
-            }
+            'comparisons': self.cube.shares(self.year)
         }
         return analysis
 
+    @memoized
     def create_monthly_comparison_plot(self):
         """Create monthly comparison visualization"""
-        fig = go.Figure()
+        traces = []
         
         # Monthly trends for domestic
-        domestic_monthly = self.domestic_df.select_dtypes(include=[np.number]).mean()
-        fig.add_trace(go.Scatter(
+        domestic_monthly = self.monthly_means('domestic')
+        traces.append(trace(
+            'scatter',
             x=list(domestic_monthly.index),
             y=domestic_monthly.values,
             name='Domestic',
@@ -82,79 +86,94 @@ class ForeignDomesticAnalyzer:
         ))
         
         # Monthly trends for foreign
-        foreign_monthly = self.foreign_df.select_dtypes(include=[np.number]).mean()
-        fig.add_trace(go.Scatter(
+        foreign_monthly = self.monthly_means('foreign')
+        traces.append(trace(
+            'scatter',
             x=list(foreign_monthly.index),
             y=foreign_monthly.values,
             name='Foreign',
             mode='lines+markers'
         ))
         
-        fig.update_layout(
+        return figure(
+            *traces,
             title='Monthly Domestic vs Foreign Visitors',
             xaxis_title='Month',
             yaxis_title='Average Visitors',
             template='plotly_white',
             showlegend=True
         )
-        
-        return json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder)
 
+    @memoized
     def create_regional_distribution_plot(self):
         """Create regional distribution visualization"""
-        fig = go.Figure()
+        traces = []
         
         # Regional totals for domestic
-        domestic_regional = self.domestic_df.select_dtypes(include=[np.number]).sum()
-        fig.add_trace(go.Bar(
+        domestic_regional = self.monthly_sums('domestic')
+        traces.append(trace(
+            'bar',
             name='Domestic',
             x=domestic_regional.index,
             y=domestic_regional.values
         ))
         
         # Regional totals for foreign
-        foreign_regional = self.foreign_df.select_dtypes(include=[np.number]).sum()
-        fig.add_trace(go.Bar(
+        foreign_regional = self.monthly_sums('foreign')
+        traces.append(trace(
+            'bar',
             name='Foreign',
             x=foreign_regional.index,
             y=foreign_regional.values
         ))
         
-        fig.update_layout(
+        return figure(
+            *traces,
             title='Regional Distribution of Domestic vs Foreign Visitors',
             xaxis_title='Region',
             yaxis_title='Total Visitors',
             barmode='group',
             template='plotly_white'
         )
-        
-        return json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder)
 
+    @memoized
     def create_pie_chart(self):
         """Create pie chart for domestic vs foreign distribution"""
         analysis = self.analyze_data()
         
-        fig = go.Figure(data=[go.Pie(
+        traces = [trace(
+            'pie',
             labels=['Domestic', 'Foreign'],
             values=[analysis['domestic']['total'], analysis['foreign']['total']],
             hole=.3
-        )])
+        )]
         
-        fig.update_layout(
+        return figure(
+            *traces,
             title='Distribution of Domestic vs Foreign Visitors',
             template='plotly_white'
         )
-        
-        return json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder)
+
+    def get_analysis(self):
+        """Get the domestic and foreign summaries without building any figure"""
+        return self.analyze_data()
+
+    @memoized
+    def get_plot(self, name):
+        """Get the JSON of one figure from PLOTS"""
+        return plot_json(getattr(self, self.PLOTS[name])())
+
+    def get_plot_window(self, name, x0, x1):
+        """Get the JSON of one figure from PLOTS at full detail between x0 and x1"""
+        return plot_json(getattr(self, self.PLOTS[name])(), window=(x0, x1))
+
+    def plot_window(self, name, x0, x1):
+        """Snap an x range of one figure from PLOTS to the first and last x it selects"""
+        return snap_window(getattr(self, self.PLOTS[name])(), (x0, x1))
 
     def get_full_analysis(self):
         """Get complete analysis including visualizations"""
-        analysis = self.analyze_data()
-        
-        plot_data = {
-            'monthly_comparison': self.create_monthly_comparison_plot(),
-            'regional_distribution': self.create_regional_distribution_plot(),
-            'visitor_distribution': self.create_pie_chart()
-        }
-        
-        return analysis, plot_data
\ No newline at end of file
+        analysis = self.get_analysis()
+        # Figures are independent, so they are built concurrently
+        plot_data = dict(zip(self.PLOTS, parallel_map(self.get_plot, self.PLOTS, processes=False)))
+        return analysis, plot_data
@@ -1,102 +1,95 @@
 # all_analysis/nuts2_foreign_domestic.py
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-import json
-import plotly
-import numpy as np
+from all_analysis.computation import graph_for, memoized
+from all_analysis.executor import parallel_map
+from all_analysis.figures import figure, plot_json, trace
+from all_analysis.reduction import snap_window
+from all_analysis.cube import latest_common_year, load_cube
+from all_analysis.tourism_data import series_files, series_version
+
 
 class NUTS2ForeignDomesticAnalyzer:
-    def __init__(self):
-        self.domestic_df = None
-        self.foreign_df = None
+    SERIES = ((2, 'domestic'), (2, 'foreign'))
+    # Figures served by get_plot(), by name
+    PLOTS = {
+        'monthly_comparison': 'create_monthly_comparison_plot',
+        'regional_distribution': 'create_regional_distribution_plot',
+        'visitor_distribution': 'create_pie_chart',
+    }
+
+    def __init__(self, year=None):
+        self.year = year
+        self.cube = None
         self.load_data()
+        self.graph = graph_for(type(self).__name__, {series: series_version(*series) for series in self.SERIES}, self.year)
+
+    @classmethod
+    def data_files(cls):
+        """Paths of every workbook this analyzer reads"""
+        return [path for level, origin in cls.SERIES for path in series_files(level, origin)]
 
     def load_data(self):
-        """Load domestic and foreign NUTS2 data"""
+        """Load the NUTS2 aggregate cube"""
         try:
-            self.domestic_df = pd.read_excel('data/nuts_2_2023_domestic.xlsx')
-            self.foreign_df = pd.read_excel('data/nuts_2_2023_foreigner.xlsx')
-            self.clean_data()
+            self.cube = load_cube(2)
+            self.year = self.year or latest_common_year(self.SERIES)
         except Exception as e:
             print(f"Error loading data: {e}")
             raise
 
-    def clean_data(self):
-        """Clean the dataframes by removing ':' values and converting to numeric"""
-        def clean_df(df):
-            cleaned = df.copy()
-            
-            # Keep first column (Region) as is
-            region_col = cleaned.iloc[:, 0]
-            
-            # Convert other columns to numeric
-            numeric_data = cleaned.iloc[:, 1:].replace(':', np.nan)
-            for col in numeric_data.columns:
-                numeric_data[col] = pd.to_numeric(numeric_data[col], errors='coerce')
-            
-            # Combine back
-            cleaned = pd.concat([region_col, numeric_data], axis=1)
-            cleaned = cleaned.dropna(how='all', subset=cleaned.columns[1:])
-            return cleaned
+    def monthly_means(self, origin):
+        """Mean of each month across regions"""
+        return self.cube.monthly('mean', self.year, origin)
 
-        self.domestic_df = clean_df(self.domestic_df)
-        self.foreign_df = clean_df(self.foreign_df)
+    def regional_totals(self, origin):
+        """Yearly total of each region, ordered by region code"""
+        return self.cube.regional('sum', self.year, origin).sort_index()
 
+    @memoized
     def analyze_data(self):
         """Analyze both domestic and foreign data"""
-        def get_analysis(df, name):
-            # Get numeric columns (excluding Region column)
-            numeric_cols = df.select_dtypes(include=[np.number]).columns
-            
+        def get_analysis(origin, name):
             # Calculate monthly averages
-            monthly_data = df[numeric_cols].mean()
+            monthly_data = self.monthly_means(origin)
             peak_month = monthly_data.idxmax()
             low_month = monthly_data.idxmin()
             
-            # Calculate regional totals
-            regional_data = df.groupby(df.columns[0])[numeric_cols].sum()
-            top_regions = regional_data.sum(axis=1).sort_values(ascending=False).head(5)
-            
             return {
-                'total': float(df[numeric_cols].sum().sum()),
+                'total': self.cube.total('sum', self.year, origin),
                 'average_monthly': float(monthly_data.mean()),
-                'max_month': float(df[numeric_cols].max().max()),
-                'min_month': float(df[numeric_cols].min().min()),
+                'max_month': self.cube.total('max', self.year, origin),
+                'min_month': self.cube.total('min', self.year, origin),
                 'peak_month': peak_month,
                 'low_month': low_month,
-                'regional_totals': regional_data.sum(axis=1).to_dict(),
+                'regional_totals': self.regional_totals(origin).to_dict(),
                 'monthly_totals': monthly_data.to_dict(),
-                'top_regions': top_regions.to_dict(),
+                'top_regions': self.cube.top_regions(self.year, origin, 5).to_dict(),
                 'name': name
             }
 
-        domestic_analysis = get_analysis(self.domestic_df, 'Domestic')
-        foreign_analysis = get_analysis(self.foreign_df, 'Foreign')
+        domestic_analysis = get_analysis('domestic', 'Domestic')
+        foreign_analysis = get_analysis('foreign', 'Foreign')
 
-        total_visitors = domestic_analysis['total'] + foreign_analysis['total']
+        comparisons = self.cube.shares(self.year)
+        comparisons['ratio'] = foreign_analysis['total'] / domestic_analysis['total'] if domestic_analysis['total'] else 0.0
+        # Regions whose domestic and foreign guests come in the most different months
+        divergence = self.cube.seasonal_divergence(self.year)
         analysis = {
             'domestic': domestic_analysis,
             'foreign': foreign_analysis,
-            'comparisons': {
-                'domestic_percentage': (domestic_analysis['total'] / total_visitors) * 100,
-                'foreign_percentage': (foreign_analysis['total'] / total_visitors) * 100,
-                'total_visitors': total_visitors,
-                'ratio': foreign_analysis['total'] / domestic_analysis['total']
-            }
+            'comparisons': comparisons,
+            'seasonal_divergence': divergence.nlargest(5).to_dict()
         }
         return analysis
 
+    @memoized
     def create_monthly_comparison_plot(self):
         """Create monthly comparison visualization"""
-        fig = go.Figure()
-        
-        # Get numeric columns
-        numeric_cols = self.domestic_df.select_dtypes(include=[np.number]).columns
+        traces = []
         
         # Monthly trends for domestic
-        domestic_monthly = self.domestic_df[numeric_cols].mean()
-        fig.add_trace(go.Scatter(
+        domestic_monthly = self.monthly_means('domestic')
+        traces.append(trace(
+            'scatter',
             x=list(domestic_monthly.index),
             y=domestic_monthly.values,
             name='Domestic',
@@ -105,8 +98,9 @@ class NUTS2ForeignDomesticAnalyzer:
         ))
         
         # Monthly trends for foreign
-        foreign_monthly = self.foreign_df[numeric_cols].mean()
-        fig.add_trace(go.Scatter(
+        foreign_monthly = self.monthly_means('foreign')
+        traces.append(trace(
+            'scatter',
             x=list(foreign_monthly.index),
             y=foreign_monthly.values,
             name='Foreign',
@@ -114,7 +108,8 @@ class NUTS2ForeignDomesticAnalyzer:
             line=dict(color='#ff7f0e')
         ))
         
-        fig.update_layout(
+        return figure(
+            *traces,
             title='Monthly NUTS2 Domestic vs Foreign Visitors',
             xaxis_title='Month',
             yaxis_title='Average Visitors',
@@ -122,20 +117,16 @@ class NUTS2ForeignDomesticAnalyzer:
             showlegend=True,
             height=500
         )
-        
-        return json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder)
 
+    @memoized
     def create_regional_distribution_plot(self):
         """Create regional distribution visualization"""
-        fig = go.Figure()
-        
-        # Get numeric columns
-        numeric_cols = self.domestic_df.select_dtypes(include=[np.number]).columns
-        region_col = self.domestic_df.columns[0]
+        traces = []
         
         # Regional totals for domestic
-        domestic_regional = self.domestic_df.groupby(region_col)[numeric_cols].sum().sum(axis=1)
-        fig.add_trace(go.Bar(
+        domestic_regional = self.regional_totals('domestic')
+        traces.append(trace(
+            'bar',
             name='Domestic',
             x=domestic_regional.index,
             y=domestic_regional.values,
@@ -143,15 +134,17 @@ class NUTS2ForeignDomesticAnalyzer:
         ))
         
         # Regional totals for foreign
-        foreign_regional = self.foreign_df.groupby(region_col)[numeric_cols].sum().sum(axis=1)
-        fig.add_trace(go.Bar(
+        foreign_regional = self.regional_totals('foreign')
+        traces.append(trace(
+            'bar',
             name='Foreign',
             x=foreign_regional.index,
             y=foreign_regional.values,
             marker_color='#ff7f0e'
         ))
         
-        fig.update_layout(
+        return figure(
+            *traces,
             title='Regional Distribution of NUTS2 Domestic vs Foreign Visitors',
             xaxis_title='Region',
             yaxis_title='Total Visitors',
@@ -160,37 +153,48 @@ class NUTS2ForeignDomesticAnalyzer:
             height=600,
             xaxis={'tickangle': 45}
         )
-        
-        return json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder)
 
+    @memoized
     def create_pie_chart(self):
         """Create pie chart for domestic vs foreign distribution"""
         analysis = self.analyze_data()
         
-        fig = go.Figure(data=[go.Pie(
+        traces = [trace(
+            'pie',
             labels=['Domestic', 'Foreign'],
             values=[analysis['domestic']['total'], analysis['foreign']['total']],
             hole=.3,
             marker=dict(colors=['#1f77b4', '#ff7f0e'])
-        )])
+        )]
         
-        fig.update_layout(
+        return figure(
+            *traces,
             title='Distribution of NUTS2 Domestic vs Foreign Visitors',
             template='plotly_white',
             height=400,
             annotations=[dict(text='Total', x=0.5, y=0.5, font_size=20, showarrow=False)]
         )
-        
-        return json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder)
+
+    def get_analysis(self):
+        """Get the domestic and foreign summaries without building any figure"""
+        return self.analyze_data()
+
+    @memoized
+    def get_plot(self, name):
+        """Get the JSON of one figure from PLOTS"""
+        return plot_json(getattr(self, self.PLOTS[name])())
+
+    def get_plot_window(self, name, x0, x1):
+        """Get the JSON of one figure from PLOTS at full detail between x0 and x1"""
+        return plot_json(getattr(self, self.PLOTS[name])(), window=(x0, x1))
+
+    def plot_window(self, name, x0, x1):
+        """Snap an x range of one figure from PLOTS to the first and last x it selects"""
+        return snap_window(getattr(self, self.PLOTS[name])(), (x0, x1))
 
     def get_full_analysis(self):
         """Get complete analysis including visualizations"""
-        analysis = self.analyze_data()
-        
-        plot_data = {
-            'monthly_comparison': self.create_monthly_comparison_plot(),
-            'regional_distribution': self.create_regional_distribution_plot(),
-            'visitor_distribution': self.create_pie_chart()
-        }
-        
-        return analysis, plot_data
\ No newline at end of file
+        analysis = self.get_analysis()
+        # Figures are independent, so they are built concurrently
+        plot_data = dict(zip(self.PLOTS, parallel_map(self.get_plot, self.PLOTS, processes=False)))
+        return analysis, plot_data
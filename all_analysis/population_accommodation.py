@@ -1,93 +1,80 @@
 # all_analysis/population_accommodation.py
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-import json
-import plotly
-import numpy as np
+from all_analysis.computation import depends_on, graph_for, memoized
+from all_analysis.executor import parallel_map
+from all_analysis.figures import figure, plot_json, trace
+from all_analysis.reduction import snap_window
+from all_analysis.dataset_store import prefetch
+from all_analysis.cube import latest_common_year, load_cube
+from all_analysis.tourism_data import load_series, series_files, series_version
+
 
 class PopulationAccommodationAnalyzer:
-    def __init__(self):
-        self.nuts1_pop = None
-        self.nuts2_pop = None
-        self.nuts1_acc = None
-        self.nuts2_acc = None
+    SERIES = ((1, 'population'), (2, 'population'), (1, 'total'), (2, 'total'))
+    # Figures served by get_plot(), by name
+    PLOTS = {
+        'intensity_map': 'create_intensity_map',
+        'seasonal_pattern': 'create_seasonal_pattern_plot',
+        'population_accommodation': 'create_population_vs_accommodation_plot',
+    }
+
+    def __init__(self, year=None):
+        self.year = year
+        self.nuts1_cube = None
+        self.nuts2_cube = None
+        self.nuts1_per_capita = None
+        self.nuts2_per_capita = None
         self.load_data()
+        self.graph = graph_for(type(self).__name__, {series: series_version(*series) for series in self.SERIES}, self.year)
+
+    @classmethod
+    def data_files(cls):
+        """Paths of every workbook this analyzer reads"""
+        return [path for level, origin in cls.SERIES for path in series_files(level, origin)]
 
     def load_data(self):
-        """Load population and accommodation data"""
+        """Load the accommodation cubes and join them to population by region code"""
         try:
-            # Load population data
-            self.nuts1_pop = pd.read_excel('data/nuts_1_population.xlsx')
-            self.nuts2_pop = pd.read_excel('data/nuts_2_population.xlsx')
-            
-            # Load accommodation data
-            self.nuts1_acc = pd.read_excel('data/nuts_1_2023.xlsx')
-            self.nuts2_acc = pd.read_excel('data/nuts_2_2023.xlsx')
-            
-            self.clean_data()
+            # The cubes parse their own workbooks only when no published copy can be attached
+            prefetch(series_files(1, 'population') + series_files(2, 'population'))
+            self.nuts1_cube = load_cube(1)
+            self.nuts2_cube = load_cube(2)
+            self.year = self.year or latest_common_year(self.SERIES)
+
+            # Population of the same year, or the latest one before it
+            self.nuts1_per_capita = self.nuts1_cube.per_capita(load_series(1, 'population'))
+            self.nuts2_per_capita = self.nuts2_cube.per_capita(load_series(2, 'population'))
         except Exception as e:
             print(f"Error loading data: {e}")
             raise
 
-    def clean_data(self):
-        """Clean and prepare the data"""
-        def clean_accommodation_df(df):
-            cleaned = df.copy()
-            # Replace ':' with NaN
-            cleaned = cleaned.replace(':', np.nan)
-            
-            # Convert numeric columns
-            numeric_cols = cleaned.columns[1:] if isinstance(cleaned.columns[0], str) else cleaned.columns
-            for col in numeric_cols:
-                cleaned[col] = pd.to_numeric(cleaned[col], errors='coerce')
-            
-            return cleaned.dropna(how='all')
-
-        def clean_population_df(df):
-            cleaned = df.copy()
-            # Assuming the last column is the population data
-            pop_col = cleaned.columns[-1]
-            cleaned[pop_col] = pd.to_numeric(cleaned[pop_col], errors='coerce')
-            return cleaned
-
-        self.nuts1_acc = clean_accommodation_df(self.nuts1_acc)
-        self.nuts2_acc = clean_accommodation_df(self.nuts2_acc)
-        self.nuts1_pop = clean_population_df(self.nuts1_pop)
-        self.nuts2_pop = clean_population_df(self.nuts2_pop)
+    def monthly_sums(self, name):
+        """Total accommodation of each month across regions for one NUTS level"""
+        return getattr(self, name).monthly('sum', self.year, 'total')
 
+    @memoized
     def calculate_intensity_metrics(self):
         """Calculate accommodation intensity metrics"""
-        # Get population column names
-        nuts1_pop_col = self.nuts1_pop.columns[-1]
-        nuts2_pop_col = self.nuts2_pop.columns[-1]
+        def get_intensity_stats(name):
+            # Regions are matched on their NUTS codes, never on row position
+            table = getattr(self, name).table(self.year)
+            return {
+                'intensity': table['intensity'].to_dict(),
+                'total_accommodation': table['accommodation'].to_dict(),
+                'population': table['population'].to_dict()
+            }
 
-        # NUTS1 calculations
-        nuts1_acc_total = self.nuts1_acc.iloc[:, 1:].sum(axis=1)
-        nuts1_intensity = (nuts1_acc_total / self.nuts1_pop[nuts1_pop_col]).fillna(0)
-        
-        # NUTS2 calculations
-        nuts2_acc_total = self.nuts2_acc.iloc[:, 1:].sum(axis=1)
-        nuts2_intensity = (nuts2_acc_total / self.nuts2_pop[nuts2_pop_col]).fillna(0)
-        
         return {
-            'nuts1': {
-                'intensity': nuts1_intensity.to_dict(),
-                'total_accommodation': nuts1_acc_total.to_dict(),
-                'population': self.nuts1_pop[nuts1_pop_col].to_dict()
-            },
-            'nuts2': {
-                'intensity': nuts2_intensity.to_dict(),
-                'total_accommodation': nuts2_acc_total.to_dict(),
-                'population': self.nuts2_pop[nuts2_pop_col].to_dict()
-            }
+            'nuts1': get_intensity_stats('nuts1_per_capita'),
+            'nuts2': get_intensity_stats('nuts2_per_capita')
         }
 
+    @memoized
+    @depends_on((1, 'total'), (2, 'total'))
     def analyze_seasonal_patterns(self):
         """Analyze seasonal patterns in accommodation"""
-        def get_seasonal_stats(df):
-            numeric_cols = df.select_dtypes(include=[np.number]).columns
-            monthly_totals = df[numeric_cols].sum()
+        def get_seasonal_stats(name):
+            monthly_totals = self.monthly_sums(name)
             peak_month = monthly_totals.idxmax()
             low_month = monthly_totals.idxmin()
             seasonality_index = monthly_totals.std() / monthly_totals.mean()
@@ -99,10 +86,30 @@ class PopulationAccommodationAnalyzer:
             }
         
         return {
-            'nuts1': get_seasonal_stats(self.nuts1_acc),
-            'nuts2': get_seasonal_stats(self.nuts2_acc)
+            'nuts1': get_seasonal_stats('nuts1_cube'),
+            'nuts2': get_seasonal_stats('nuts2_cube')
+        }
+
+    @memoized
+    @depends_on((1, 'total'), (2, 'total'))
+    def analyze_regional_seasonality(self):
+        """Find the most and least seasonal regions of each level"""
+        def get_regional_stats(name):
+            regions = getattr(self, name).regional_seasonality(self.year).sort_values('seasonality_index')
+            most, least = regions.iloc[-1], regions.iloc[0]
+            return {
+                'seasonality_index': regions['seasonality_index'].to_dict(),
+                'most_seasonal': (most.name, float(most['seasonality_index']), float(most['gini'])),
+                'least_seasonal': (least.name, float(least['seasonality_index']), float(least['gini'])),
+                'median_gini': float(regions['gini'].median())
+            }
+
+        return {
+            'nuts1': get_regional_stats('nuts1_cube'),
+            'nuts2': get_regional_stats('nuts2_cube')
         }
 
+    @memoized
     def create_intensity_map(self):
         """Create visualization for accommodation intensity"""
         metrics = self.calculate_intensity_metrics()
@@ -113,15 +120,19 @@ class PopulationAccommodationAnalyzer:
             'Intensity': list(metrics['nuts1']['intensity'].values())
         })
         
-        fig = go.Figure()
-        fig.add_trace(go.Bar(
+        traces = []
+        traces.append(trace(
+            'bar',
             x=intensity_data['Region'],
             y=intensity_data['Intensity'],
             name='NUTS1 Regions',
-            marker_color='#1f77b4'
+            marker_color='#1f77b4',
+            # Regions beyond the bar limit are shown as their mean intensity, not summed
+            meta={'other': 'mean'}
         ))
         
-        fig.update_layout(
+        return figure(
+            *traces,
             title='Accommodation Intensity by Region (Guests per Capita)',
             xaxis_title='Region',
             yaxis_title='Guests per Capita',
@@ -129,53 +140,53 @@ class PopulationAccommodationAnalyzer:
             height=500,
             xaxis={'tickangle': 45}
         )
-        
-        return json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder)
 
+    @memoized
+    @depends_on((1, 'total'))
     def create_seasonal_pattern_plot(self):
         """Create visualization for seasonal patterns"""
-        fig = go.Figure()
+        traces = []
         
         # NUTS1 seasonal pattern
-        nuts1_monthly = self.nuts1_acc.select_dtypes(include=[np.number]).sum()
-        fig.add_trace(go.Scatter(
+        nuts1_monthly = self.monthly_sums('nuts1_cube')
+        traces.append(trace(
+            'scatter',
             x=list(nuts1_monthly.index),
             y=nuts1_monthly.values,
             name='NUTS1',
             mode='lines+markers'
         ))
         
-        fig.update_layout(
+        return figure(
+            *traces,
             title='Seasonal Pattern of Accommodation Usage',
             xaxis_title='Month',
             yaxis_title='Total Guests',
             template='plotly_white',
             height=500
         )
-        
-        return json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder)
 
+    @memoized
     def create_population_vs_accommodation_plot(self):
         """Create scatter plot of population vs accommodation"""
         metrics = self.calculate_intensity_metrics()
         
-        # Get population column names
-        nuts1_pop_col = self.nuts1_pop.columns[-1]
-        
-        fig = go.Figure()
+        traces = []
         
         # NUTS1 scatter plot
-        fig.add_trace(go.Scatter(
+        traces.append(trace(
+            'scatter',
             x=list(metrics['nuts1']['population'].values()),
             y=list(metrics['nuts1']['total_accommodation'].values()),
             mode='markers+text',
             name='NUTS1 Regions',
-            text=list(metrics['nuts1']['population'].keys()),
+            text=[str(region) for region in metrics['nuts1']['population']],
             textposition="top center",
             marker=dict(size=12)
         ))
         
-        fig.update_layout(
+        return figure(
+            *traces,
             title='Population vs Total Accommodation by Region',
             xaxis_title='Population',
             yaxis_title='Total Accommodation',
@@ -183,31 +194,46 @@ class PopulationAccommodationAnalyzer:
             height=600,
             showlegend=True
         )
-        
-        return json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder)
 
-    def get_full_analysis(self):
-        """Get complete analysis including visualizations"""
+    @memoized
+    def get_analysis(self):
+        """Get the intensity, seasonal and insight summaries without building any figure"""
         metrics = self.calculate_intensity_metrics()
         seasonal = self.analyze_seasonal_patterns()
+        regional = self.analyze_regional_seasonality()
         
         # Combine analyses
-        analysis = {
+        return {
             'metrics': metrics,
             'seasonal': seasonal,
+            'regional_seasonality': regional,
             'insights': {
                 'nuts1_highest_intensity': max(metrics['nuts1']['intensity'].items(), key=lambda x: x[1]),
                 'nuts1_lowest_intensity': min(metrics['nuts1']['intensity'].items(), key=lambda x: x[1]),
                 'seasonality_index_nuts1': seasonal['nuts1']['seasonality_index'],
                 'peak_month_nuts1': seasonal['nuts1']['peak_month'],
-                'low_month_nuts1': seasonal['nuts1']['low_month']
+                'low_month_nuts1': seasonal['nuts1']['low_month'],
+                'nuts2_most_seasonal': regional['nuts2']['most_seasonal'],
+                'nuts2_least_seasonal': regional['nuts2']['least_seasonal']
             }
         }
-        
-        plot_data = {
-            'intensity_map': self.create_intensity_map(),
-            'seasonal_pattern': self.create_seasonal_pattern_plot(),
-            'population_accommodation': self.create_population_vs_accommodation_plot()
-        }
-        
-        return analysis, plot_data
\ No newline at end of file
+
+    @memoized
+    def get_plot(self, name):
+        """Get the JSON of one figure from PLOTS"""
+        return plot_json(getattr(self, self.PLOTS[name])())
+
+    def get_plot_window(self, name, x0, x1):
+        """Get the JSON of one figure from PLOTS at full detail between x0 and x1"""
+        return plot_json(getattr(self, self.PLOTS[name])(), window=(x0, x1))
+
+    def plot_window(self, name, x0, x1):
+        """Snap an x range of one figure from PLOTS to the first and last x it selects"""
+        return snap_window(getattr(self, self.PLOTS[name])(), (x0, x1))
+
+    def get_full_analysis(self):
+        """Get complete analysis including visualizations"""
+        analysis = self.get_analysis()
+        # Figures are independent, so they are built concurrently
+        plot_data = dict(zip(self.PLOTS, parallel_map(self.get_plot, self.PLOTS, processes=False)))
+        return analysis, plot_data
@@ -0,0 +1,82 @@
+# all_analysis/profiler.py
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+
+def _fold(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class Profile:
+    """Stack samples of one thread"""
+
+    def __init__(self, thread_id):
+        self.thread_id = thread_id
+        self.stacks = Counter()
+
+    def folded(self):
+        """The samples in the folded format read by flamegraph.pl and speedscope"""
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+class Sampler:
+    """Sample the stacks of every profiled thread from one background thread"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._profiles = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self, thread_id=None):
+        """Start sampling a thread, the calling one by default"""
+        profile = Profile(thread_id or threading.get_ident())
+        with self._lock:
+            self._profiles[id(profile)] = profile
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+                self._thread.start()
+        return profile
+
+    def stop(self, profile):
+        """Stop sampling and return the collected profile"""
+        with self._lock:
+            self._profiles.pop(id(profile), None)
+        return profile
+
+    def _run(self):
+        while True:
+            with self._lock:
+                profiles = list(self._profiles.values())
+                if not profiles:
+                    # Exit while idle; the next start() launches a new thread
+                    self._thread = None
+                    return
+            frames = sys._current_frames()
+            for profile in profiles:
+                frame = frames.get(profile.thread_id)
+                if frame is not None:
+                    profile.stacks[_fold(frame)] += 1
+            del frames
+            time.sleep(self.interval)
+
+
+def write_profile(profile, directory, label, seconds):
+    """Save a profile as <time>-<label>-<ms>ms.folded and return its path"""
+    os.makedirs(directory, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S.%f')
+    safe_label = re.sub(r'[^A-Za-z0-9_.-]+', '_', label).strip('_') or 'request'
+    path = os.path.join(directory, f'{stamp}-{safe_label}-{seconds * 1000:.0f}ms.folded')
+    with open(path, 'w') as f:
+        f.write(profile.folded())
+    return path
@@ -0,0 +1,213 @@
+# all_analysis/query.py
+import numpy as np
+
+from all_analysis.cube import MONTH_LABELS, ORIGINS
+from all_analysis.errors import QueryError
+from all_analysis.growth import GROWTH_METRICS
+from all_analysis.seasonality import METRICS
+
+AGGREGATIONS = ('sum', 'mean', 'max', 'min', 'share')
+GROUP_AXES = ('region', 'year', 'month')
+SEASONALITY_COLUMNS = METRICS + ('divergence',)
+GROWTH_COLUMNS = ('value',) + GROWTH_METRICS
+
+
+def parse_range(text, valid, name):
+    """Parse '2021', '2021,2023' or '2021-2023' into the matching values of valid
+
+    No text selects every valid value; a range that is reversed or matches
+    none of them is an error rather than an empty selection.
+    """
+    if not text:
+        return list(valid)
+    selected = []
+    for part in text.split(','):
+        try:
+            if '-' in part:
+                low, high = (int(v.strip().lstrip('M')) for v in part.split('-', 1))
+            else:
+                selected.append(int(part.strip().lstrip('M')))
+                continue
+        except ValueError:
+            raise QueryError(f'Invalid {name}: {part!r}') from None
+        if low > high:
+            raise QueryError(f'Invalid {name}: {part!r} ends before it starts')
+        matched = [v for v in valid if low <= v <= high]
+        if not matched:
+            raise QueryError(f'No data for {name} {part.strip()}')
+        selected.extend(matched)
+    unknown = sorted(set(selected) - set(valid))
+    if unknown:
+        raise QueryError(f'No data for {name} {unknown}')
+    return sorted(set(selected))
+
+
+def _region_positions(cube, regions):
+    """Positions of region codes in the cube, every region when none are given
+
+    A code given twice is kept once, in the place it first appears, so it is never counted twice.
+    """
+    if not regions:
+        return np.arange(len(cube.regions))
+    regions = list(dict.fromkeys(regions))
+    positions = cube.regions.get_indexer(regions)
+    missing = [code for code, position in zip(regions, positions) if position < 0]
+    if missing:
+        raise QueryError(f'Unknown NUTS{cube.level} regions {missing}')
+    return positions
+
+
+def _sorted_rows(rows, grids, sort, columns):
+    """Order rows by the grid a sort such as 'gini' or '-gini' names; missing values sort last"""
+    if not sort:
+        return rows
+    key = sort.lstrip('-')
+    if key not in columns:
+        raise QueryError(f'Cannot sort by {key!r}, expected one of {", ".join(columns)}')
+    values = grids[key][rows].astype(np.float64)
+    return rows[np.argsort(-values if sort.startswith('-') else values, kind='stable')]
+
+
+def _aggregate(block, agg, axes):
+    """Reduce a region × year × month block over the given axes"""
+    count = (~np.isnan(block)).sum(axis=axes)
+    if agg in ('sum', 'share'):
+        result = np.nansum(block, axis=axes, dtype=np.float64)
+    elif agg == 'mean':
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result = np.nansum(block, axis=axes, dtype=np.float64) / count
+    elif agg == 'max':
+        result = np.fmax.reduce(block, axis=axes, initial=np.nan).astype(np.float64)
+    else:
+        result = np.fmin.reduce(block, axis=axes, initial=np.nan).astype(np.float64)
+    return result, count
+
+
+def run_query(cube, regions=None, years=None, months=None, origin='total', agg='sum', group_by=('region',)):
+    """Aggregate a slice of the cube and return it as columns
+
+    share is the percentage each group contributes to the same group taken
+    over every region of the level (e.g. a region's share of the national total).
+    """
+    if origin not in ORIGINS:
+        raise QueryError(f'Unknown origin {origin!r}, expected one of {", ".join(ORIGINS)}')
+    if agg not in AGGREGATIONS:
+        raise QueryError(f'Unknown aggregation {agg!r}, expected one of {", ".join(AGGREGATIONS)}')
+    unknown_axes = [axis for axis in group_by if axis not in GROUP_AXES]
+    if unknown_axes:
+        raise QueryError(f'Cannot group by {unknown_axes}, expected any of {", ".join(GROUP_AXES)}')
+
+    region_positions = _region_positions(cube, regions)
+    year_positions = [cube.years.index(year) for year in (cube.years if years is None else years)]
+    month_positions = np.asarray(range(1, 13) if months is None else months, dtype=int) - 1
+
+    o = ORIGINS.index(origin)
+    level_block = cube.values[:, year_positions][:, :, month_positions, o]
+    block = level_block[region_positions]
+
+    # Group axes stay, everything else is reduced
+    axes = tuple(i for i, axis in enumerate(GROUP_AXES) if axis not in group_by)
+    result, count = _aggregate(block, agg, axes)
+    if agg == 'share':
+        totals, _ = _aggregate(level_block, 'sum', axes)
+        if 'region' in group_by:
+            totals = totals.sum(axis=0, keepdims=True)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result = result / totals * 100
+
+    # Flatten the grouped axes into rows, dropping groups without any observation
+    labels = {
+        'region': np.asarray(cube.regions)[region_positions],
+        'year': np.asarray(cube.years)[year_positions],
+        'month': np.asarray(MONTH_LABELS)[month_positions],
+    }
+    kept_axes = [axis for axis in GROUP_AXES if axis in group_by]
+    grids = np.meshgrid(*(np.arange(len(labels[axis])) for axis in kept_axes), indexing='ij')
+    present = np.atleast_1d(count > 0).ravel()
+
+    columns = {axis: labels[axis][grid.ravel()[present]].tolist() for axis, grid in zip(kept_axes, grids)}
+    values = np.atleast_1d(result).ravel()[present]
+    columns['value'] = [None if np.isnan(v) else float(v) for v in values]
+    return columns
+
+
+def seasonality_table(cube, regions=None, years=None, origins=ORIGINS, sort=None):
+    """Seasonality metrics of each region, year and origin as columns
+
+    Rows without two months of data are dropped. sort names a metric,
+    prefixed with '-' for descending order; missing values sort last.
+    """
+    unknown = [origin for origin in origins if origin not in ORIGINS]
+    if unknown:
+        raise QueryError(f'Unknown origin {unknown}, expected any of {", ".join(ORIGINS)}')
+
+    region_positions = _region_positions(cube, regions)
+    year_positions = [cube.years.index(year) for year in (cube.years if years is None else years)]
+    origin_positions = [ORIGINS.index(origin) for origin in origins]
+
+    # Region × year × origin grids of every metric, flattened into rows
+    metrics = cube.seasonality()
+    index = np.ix_(region_positions, year_positions, origin_positions)
+    grids = {name: metrics[name][index].ravel() for name in METRICS}
+    divergence = metrics['divergence'][np.ix_(region_positions, year_positions)]
+    grids['divergence'] = np.repeat(divergence, len(origin_positions), axis=1).ravel()
+    r, y, o = (grid.ravel() for grid in np.meshgrid(
+        region_positions, year_positions, origin_positions, indexing='ij'))
+    rows = _sorted_rows(np.flatnonzero(grids['peak_month'] > 0), grids, sort, SEASONALITY_COLUMNS)
+
+    columns = {
+        'region': np.asarray(cube.regions)[r[rows]].tolist(),
+        'year': np.asarray(cube.years)[y[rows]].tolist(),
+        'origin': np.asarray(ORIGINS)[o[rows]].tolist(),
+    }
+    for name in SEASONALITY_COLUMNS:
+        values = grids[name][rows]
+        if name in ('peak_month', 'trough_month'):
+            columns[name] = np.asarray(MONTH_LABELS)[values - 1].tolist()
+        else:
+            columns[name] = [None if np.isnan(v) else float(v) for v in values]
+    return columns
+
+
+def growth_table(cube, regions=None, years=None, months=None, origin='total', sort=None):
+    """Value and growth metrics of each region and month with data, as columns
+
+    sort names a column, prefixed with '-' for descending order; missing
+    values sort last.
+    """
+    if origin not in ORIGINS:
+        raise QueryError(f'Unknown origin {origin!r}, expected one of {", ".join(ORIGINS)}')
+    region_positions = _region_positions(cube, regions)
+    growth = cube.growth()
+    periods = np.add.outer((np.asarray(cube.years if years is None else years, dtype=int) - growth.first_year) * 12,
+                           np.asarray(range(1, 13) if months is None else months, dtype=int) - 1).ravel()
+
+    # Region × period grids of every column, flattened into rows
+    index = np.ix_(region_positions, periods, [ORIGINS.index(origin)])
+    grids = {'value': growth.values[index].ravel()}
+    grids.update((name, growth.metrics[name][index].ravel()) for name in GROWTH_METRICS)
+    r, t = (grid.ravel() for grid in np.meshgrid(region_positions, periods, indexing='ij'))
+    rows = _sorted_rows(np.flatnonzero(~np.isnan(grids['value'])), grids, sort, GROWTH_COLUMNS)
+
+    columns = {
+        'region': np.asarray(cube.regions)[r[rows]].tolist(),
+        'year': (growth.first_year + t[rows] // 12).tolist(),
+        'month': np.asarray(MONTH_LABELS)[t[rows] % 12].tolist(),
+    }
+    for name in GROWTH_COLUMNS:
+        columns[name] = [None if np.isnan(v) else float(v) for v in grids[name][rows]]
+    return columns
+
+
+def paginate(columns, page, per_page):
+    """Slice every column to one page and describe the pagination"""
+    rows = len(next(iter(columns.values())))
+    start = (page - 1) * per_page
+    return {
+        'columns': list(columns),
+        'data': {name: values[start:start + per_page] for name, values in columns.items()},
+        'page': page,
+        'per_page': per_page,
+        'total_rows': rows,
+        'pages': max(1, -(-rows // per_page)),
+    }
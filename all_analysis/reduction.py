@@ -0,0 +1,192 @@
+# all_analysis/reduction.py
+import math
+import warnings
+
+import numpy as np
+
+from all_analysis import config
+
+OTHER_LABEL = 'Other'
+
+# How a bar trace's dropped categories become the "Other" bar; a trace picks one
+# with meta={'other': ...}, e.g. 'mean' for ratios such as guests per capita
+OTHER_AGGREGATIONS = {'sum': np.nansum, 'mean': np.nanmean}
+
+
+def lttb(x, y, threshold):
+    """Indices of the points Largest-Triangle-Three-Buckets keeps out of a line of len(y) points"""
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    # First and last points are always kept; the rest is split into threshold - 2 buckets
+    every = (n - 2) / (threshold - 2)
+    selected = np.empty(threshold, dtype=np.intp)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        # The third corner of the triangle is the average of the next bucket
+        with warnings.catch_warnings():
+            # Buckets of only NaN average to NaN, which simply never wins
+            warnings.simplefilter('ignore', RuntimeWarning)
+            avg_x = np.nanmean(x[end:next_end]) if end < next_end else x[-1]
+            avg_y = np.nanmean(y[end:next_end]) if end < next_end else y[-1]
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + (int(np.nanargmax(area)) if not np.isnan(area).all() else 0)
+        selected[i + 1] = a
+    return selected
+
+
+def _is_numeric(values):
+    return np.asarray(values).dtype.kind in 'iuf'
+
+
+def _categories(traces):
+    # Category order of a shared axis: first appearance across traces
+    seen = {}
+    for trace in traces:
+        for label in trace.get('x', ()):
+            seen.setdefault(label, None)
+    return list(seen)
+
+
+def _take(trace, keep, keys=('x', 'y', 'text')):
+    # Subset every per-point array of a trace
+    trace = dict(trace)
+    for key in keys:
+        if key in trace and not isinstance(trace[key], str):
+            trace[key] = np.asarray(trace[key])[keep]
+    return trace
+
+
+def window_traces(traces, window):
+    """Keep the points of each trace inside an x window
+
+    Numeric axes are cut by value; category axes by position in the shared
+    category order, so x0=10, x1=19 are the eleventh to twentieth categories.
+    """
+    x0, x1 = window
+    categories = _categories([t for t in traces if 'x' in t and not _is_numeric(t['x'])])
+    visible = set(categories[max(0, math.ceil(x0)):max(0, math.floor(x1) + 1)])
+    windowed = []
+    for trace in traces:
+        if 'x' not in trace:
+            windowed.append(trace)
+        elif _is_numeric(trace['x']):
+            x = np.asarray(trace['x'])
+            windowed.append(_take(trace, (x >= x0) & (x <= x1)))
+        else:
+            windowed.append(_take(trace, np.array([label in visible for label in trace['x']], dtype=bool)))
+    return windowed
+
+
+# Window every x range that selects no point snaps to, whatever the axis
+EMPTY_WINDOW = (0, -1)
+
+
+def snap_window(spec, window):
+    """Narrow an x window to the first and last x it selects, so ranges that select the same points are equal
+
+    Category axes snap to whole positions, numeric axes to the x values of
+    their points. A figure mixing both is left as it is.
+    """
+    x0, x1 = window
+    traces = [t for t in spec['data'] if 'x' in t]
+    numeric = [np.asarray(t['x'], dtype=float) for t in traces if _is_numeric(t['x'])]
+    if numeric and len(numeric) < len(traces):
+        return window
+    if not numeric:
+        first = max(0, math.ceil(x0))
+        last = min(len(_categories(traces)) - 1, math.floor(x1))
+        return (first, last) if first <= last else EMPTY_WINDOW
+    x = np.unique(np.concatenate(numeric))
+    first = np.searchsorted(x, x0, side='left')
+    last = np.searchsorted(x, x1, side='right') - 1
+    # NaN sorts last and is never inside a window
+    return (float(x[first]), float(x[last])) if first <= last and not np.isnan(x[last]) else EMPTY_WINDOW
+
+
+def top_n_bars(traces, max_bars, other_label=OTHER_LABEL):
+    """Keep the max_bars - 1 largest categories of the bar traces and sum the rest into one bucket
+
+    Categories are ranked by their total across every bar trace so grouped
+    bars stay aligned; kept categories stay in axis order. The bucket holds
+    the sum of the dropped values unless the trace asks for another
+    aggregation in meta.other (see OTHER_AGGREGATIONS).
+    """
+    bars = [t for t in traces if t.get('type') == 'bar' and 'x' in t and not _is_numeric(t['x'])]
+    categories = _categories(bars)
+    if not max_bars or len(categories) <= max_bars:
+        return traces, False
+
+    position = {label: i for i, label in enumerate(categories)}
+    totals = np.zeros(len(categories))
+    for trace in bars:
+        idx = np.array([position[label] for label in trace['x']], dtype=np.intp)
+        np.add.at(totals, idx, np.abs(np.nan_to_num(np.asarray(trace['y'], dtype=float))))
+    kept = set(np.asarray(categories, dtype=object)[np.sort(np.argsort(-totals, kind='stable')[:max_bars - 1])])
+
+    reduced = []
+    for trace in traces:
+        if not any(trace is bar for bar in bars):
+            reduced.append(trace)
+            continue
+        x = list(trace['x'])
+        y = np.asarray(trace['y'], dtype=float)
+        keep = np.array([label in kept for label in x], dtype=bool)
+        trace = _take(trace, keep, keys=('x', 'y'))
+        trace.pop('text', None)
+        trace['x'] = list(trace['x']) + [other_label]
+        aggregate = OTHER_AGGREGATIONS[(trace.get('meta') or {}).get('other', 'sum')]
+        trace['y'] = np.append(trace['y'], aggregate(y[~keep]))
+        reduced.append(trace)
+    return reduced, True
+
+
+def downsample_lines(traces, max_points):
+    """LTTB-downsample line traces longer than max_points"""
+    changed = False
+    reduced = []
+    for trace in traces:
+        if max_points and trace.get('type') == 'scatter' and 'lines' in trace.get('mode', 'lines') \
+                and len(trace.get('y', ())) > max_points:
+            x = trace.get('x')
+            positions = np.asarray(x, dtype=float) if x is not None and _is_numeric(x) else np.arange(len(trace['y']))
+            trace = _take(trace, lttb(positions, trace['y'], max_points))
+            changed = True
+        reduced.append(trace)
+    return reduced, changed
+
+
+def reduce_figure(spec, window=None, max_bars=None, max_points=None, lod=True):
+    """Bound the payload of a figure spec: optional x window, top-N bars with an "other" bucket, LTTB lines
+
+    A reduced or windowed figure carries layout.meta.lod so the page knows to
+    fetch more detail when the user zooms in; lod=False leaves it out for
+    pages that have nowhere to fetch it from.
+    """
+    max_bars = config.PLOT_MAX_BARS if max_bars is None else max_bars
+    max_points = config.PLOT_MAX_POINTS if max_points is None else max_points
+
+    traces = spec['data']
+    if window is not None:
+        traces = window_traces(traces, window)
+    traces, bars_reduced = top_n_bars(traces, max_bars)
+    traces, lines_reduced = downsample_lines(traces, max_points)
+    if window is None and not (bars_reduced or lines_reduced):
+        return spec
+    if not lod:
+        return {'data': traces, 'layout': spec['layout']}
+
+    categorical = any('x' in t and not _is_numeric(t['x']) for t in traces)
+    lod = {'reduced': bars_reduced or lines_reduced, 'axis': 'category' if categorical else 'linear'}
+    if window is not None:
+        lod['window'] = list(window)
+        if categorical:
+            lod['offset'] = max(0, math.ceil(window[0]))
+    return {'data': traces, 'layout': {**spec['layout'], 'meta': {'lod': lod}}}
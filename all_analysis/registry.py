@@ -0,0 +1,42 @@
+# all_analysis/registry.py
+import importlib
+import threading
+import time
+
+from all_analysis.metrics import registry as metrics
+
+# Dashboard name -> (module, class) of the analyzer behind it, imported on first use
+ANALYZERS = {
+    'nuts1_and_nuts2': ('all_analysis.nuts1_and_nuts2', 'DataAnalyzer'),
+    'nuts1_foreign_domestic': ('all_analysis.nuts1_foreign_domestic', 'ForeignDomesticAnalyzer'),
+    'nuts2_foreign_domestic': ('all_analysis.nuts2_foreign_domestic', 'NUTS2ForeignDomesticAnalyzer'),
+    'population_accommodation': ('all_analysis.population_accommodation', 'PopulationAccommodationAnalyzer'),
+}
+
+_classes = {}
+_lock = threading.Lock()
+
+
+def analyzer_class(page):
+    """Return the analyzer class of a dashboard, importing its module (and pandas, plotly) on first use"""
+    cls = _classes.get(page)
+    if cls is None:
+        module_name, class_name = ANALYZERS[page]
+        with _lock:
+            cls = _classes.get(page)
+            if cls is None:
+                start = time.perf_counter()
+                module = importlib.import_module(module_name)
+                metrics.set('tourism_import_seconds', time.perf_counter() - start, module=module_name)
+                cls = _classes[page] = getattr(module, class_name)
+    return cls
+
+
+def analyzer_classes():
+    """Every registered analyzer class, by dashboard name"""
+    return {page: analyzer_class(page) for page in ANALYZERS}
+
+
+def loaded_pages():
+    """Dashboards whose analyzer has been imported"""
+    return [page for page in ANALYZERS if page in _classes]
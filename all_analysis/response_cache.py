@@ -0,0 +1,82 @@
+# all_analysis/response_cache.py
+import hashlib
+import threading
+from collections import OrderedDict, namedtuple
+
+from all_analysis.compression import compress
+
+# encoded holds the body compressed per content coding, filled on first use
+CachedResponse = namedtuple('CachedResponse', ['body', 'etag', 'last_modified', 'version', 'encoded'])
+
+
+def _entry_size(entry):
+    return len(entry.body) + sum(len(body) for body in entry.encoded.values())
+
+
+class ResponseCache:
+    """Bounded LRU of rendered responses, evicted by total body size"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        """Return the cached response for key if it was built from this dataset version"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.version != version:
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def latest(self, key):
+        """Return the cached response for key whatever dataset version it was built from"""
+        with self._lock:
+            return self._entries.get(key)
+
+    def put(self, key, version, body, last_modified):
+        """Store a rendered body, replacing any entry built from an older version"""
+        entry = CachedResponse(body, hashlib.sha256(body).hexdigest(), last_modified, version, {})
+        if len(body) > self.max_bytes:
+            return entry
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= _entry_size(previous)
+            self._entries[key] = entry
+            self._size += len(body)
+            self._evict()
+        return entry
+
+    def encoded(self, key, entry, encoding):
+        """Return the body of an entry compressed with a content coding, compressing it only once"""
+        body = entry.encoded.get(encoding)
+        if body is None:
+            body = compress(entry.body, encoding)
+            with self._lock:
+                if encoding not in entry.encoded:
+                    entry.encoded[encoding] = body
+                    # The compressed bytes count against the budget while the entry is cached
+                    if self._entries.get(key) is entry:
+                        self._size += len(body)
+                        self._evict()
+        return body
+
+    def _evict(self):
+        # Evict least recently used entries until we are back under the byte budget
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= _entry_size(evicted)
+
+    def clear(self):
+        """Drop every cached response"""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    @property
+    def size(self):
+        return self._size
@@ -0,0 +1,59 @@
+# all_analysis/seasonality.py
+import numpy as np
+
+# Per region, year and origin metrics returned by seasonality(), in column order
+METRICS = ('seasonality_index', 'gini', 'peak_month', 'trough_month', 'peak_to_trough')
+
+
+def seasonality(values, domestic=1, foreign=2):
+    """Seasonality metrics of every region, year and origin of a region × year × month × origin array
+
+    Each metric is computed over the months that have data, for all cells
+    at once:
+
+    - seasonality_index: standard deviation / mean of the monthly values
+    - gini: Gini coefficient of the monthly distribution (0 even, 1 all in one month)
+    - peak_month / trough_month: month number 1-12 of the largest / smallest value
+    - peak_to_trough: largest / smallest monthly value
+
+    plus divergence, a region × year array: half the summed absolute
+    difference between the monthly shares of domestic and foreign guests
+    (0 same seasonal pattern, 1 none of the same months). Metrics are NaN,
+    and months 0, where fewer than two months have data.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    present = ~np.isnan(values)
+    count = present.sum(axis=2)
+    total = np.nansum(values, axis=2)
+    valid = count >= 2
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+        # Sample standard deviation (ddof=1), as pandas computes it for the level-wide index
+        variance = np.nansum((values - mean[:, :, np.newaxis]) ** 2, axis=2) / (count - 1)
+        index = np.sqrt(variance) / mean
+
+        # Gini over the months sorted ascending; missing months sort last and weigh nothing
+        ordered = np.nan_to_num(np.sort(values, axis=2))
+        rank = np.arange(1, values.shape[2] + 1).reshape(1, 1, -1, 1)
+        gini = (np.sum((2 * rank - count[:, :, np.newaxis] - 1) * ordered, axis=2)) / (count * total)
+
+        high = np.fmax.reduce(values, axis=2, initial=np.nan)
+        low = np.fmin.reduce(values, axis=2, initial=np.nan)
+        ratio = high / low
+
+        shares = values / total[:, :, np.newaxis]
+        both = valid[..., domestic] & valid[..., foreign]
+        difference = np.abs(shares[..., domestic] - shares[..., foreign])
+        divergence = np.where(both, 0.5 * np.nansum(difference, axis=2), np.nan)
+
+    peak = np.where(present, values, -np.inf).argmax(axis=2) + 1
+    trough = np.where(present, values, np.inf).argmin(axis=2) + 1
+    return {
+        'seasonality_index': np.where(valid, index, np.nan),
+        'gini': np.where(valid, gini, np.nan),
+        'peak_month': np.where(valid, peak, 0),
+        'trough_month': np.where(valid, trough, 0),
+        'peak_to_trough': np.where(valid & (low > 0), ratio, np.nan),
+        'divergence': divergence,
+    }
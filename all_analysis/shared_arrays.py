@@ -0,0 +1,66 @@
+# all_analysis/shared_arrays.py
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+# Bump when the layout of published blocks changes so older ones are ignored
+SHARED_FORMAT = 1
+
+
+def publish_arrays(path, arrays, meta):
+    """Write named NumPy blocks and a JSON metadata header to the directory path, all at once
+
+    The blocks are written into a temporary directory that is renamed into
+    place, so a process attaching never sees a partial set. When another
+    process published the same path first, its copy is kept.
+    """
+    parent = os.path.dirname(path)
+    os.makedirs(parent, exist_ok=True)
+    tmp_path = tempfile.mkdtemp(dir=parent, suffix='.tmp')
+    try:
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_path, f'{name}.npy'), np.ascontiguousarray(array))
+        with open(os.path.join(tmp_path, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump({'format': SHARED_FORMAT, 'arrays': list(arrays), **meta}, f)
+        os.rename(tmp_path, path)
+    except OSError:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        if not os.path.isdir(path):
+            raise
+
+
+def attach_arrays(path):
+    """Map the blocks published at path read-only and return (arrays, meta), or None
+
+    Every process attaching the same path shares one copy of the blocks in
+    the page cache; nothing is read until it is used.
+    """
+    try:
+        with open(os.path.join(path, 'meta.json'), 'rb') as f:
+            meta = json.loads(f.read())
+        if meta.get('format') != SHARED_FORMAT:
+            return None
+        arrays = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r') for name in meta['arrays']}
+    except (OSError, ValueError):
+        return None
+    return arrays, meta
+
+
+def prune_arrays(path, prefix):
+    """Remove the blocks published next to path under names starting with prefix, keeping path
+
+    Blocks derived from path (named path.<name>) are kept too. Processes
+    still attached to a removed set keep their mapping; only new attaches
+    miss it.
+    """
+    parent, name = os.path.split(path)
+    try:
+        entries = os.listdir(parent)
+    except OSError:
+        return
+    for entry in entries:
+        if entry.startswith(prefix) and entry != name and not entry.startswith(name + '.'):
+            shutil.rmtree(os.path.join(parent, entry), ignore_errors=True)
@@ -0,0 +1,79 @@
+# all_analysis/single_flight.py
+import threading
+
+from all_analysis.metrics import registry
+
+
+class FlightTimeout(Exception):
+    """Raised to a caller that gave up waiting for a call another caller is running"""
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key into one
+
+    The first caller of a key runs the call; callers arriving while it runs
+    wait for its result, or get its exception, instead of running the same
+    work again. Nothing is kept once the call returns: caching the result is
+    up to the caller.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def _run(self, key, flight, func):
+        try:
+            flight.result = func()
+        except Exception as e:
+            flight.error = e
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def do(self, key, func, timeout=None):
+        """Return func(), or the result of the call for key already in flight"""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        registry.increment('tourism_single_flight_total', flight=self.name, role='leader' if leader else 'waiter')
+
+        if leader:
+            self._run(key, flight, func)
+        elif not flight.done.wait(timeout):
+            registry.increment('tourism_single_flight_total', flight=self.name, role='timeout')
+            raise FlightTimeout(f'Gave up after {timeout}s waiting for {key!r}')
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    def start(self, key, func):
+        """Run func on a background thread unless a call for key is in flight; return whether it started"""
+        with self._lock:
+            if key in self._flights:
+                return False
+            flight = self._flights[key] = _Flight()
+        registry.increment('tourism_single_flight_total', flight=self.name, role='background')
+
+        def run():
+            self._run(key, flight, func)
+            if flight.error is not None:
+                print(f"Error refreshing {key!r} in the background: {flight.error}")
+
+        threading.Thread(target=run, name=f'{self.name}-refresh', daemon=True).start()
+        return True
+
+    def in_flight(self, key):
+        """Whether a call for key is running"""
+        with self._lock:
+            return key in self._flights
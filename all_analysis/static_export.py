@@ -0,0 +1,56 @@
+# all_analysis/static_export.py
+import hashlib
+import json
+import os
+import shutil
+
+from all_analysis.compression import ENCODINGS, SUFFIXES, compress
+
+
+def hashed_name(path, body):
+    """Insert a digest of body before the extension: plots/trend.json -> plots/trend.<digest>.json"""
+    stem, ext = os.path.splitext(path)
+    return f'{stem}.{hashlib.sha256(body).hexdigest()[:12]}{ext}'
+
+
+def compressed_variants(body):
+    """Precompressed copies of a body by file suffix: .gz always, .br when brotli is installed"""
+    return {SUFFIXES[encoding]: compress(body, encoding, best=True) for encoding in ENCODINGS}
+
+
+class StaticSite:
+    """Files of a static export, written next to the output directory and swapped in by publish()"""
+
+    def __init__(self, output_dir):
+        self.output_dir = os.path.abspath(output_dir)
+        self.build_dir = f'{self.output_dir}.tmp'
+        self.manifest = {}
+        self.bytes_written = 0
+        shutil.rmtree(self.build_dir, ignore_errors=True)
+        os.makedirs(self.build_dir)
+
+    def add(self, path, body):
+        """Write a file and its precompressed variants under its own name"""
+        target = os.path.join(self.build_dir, path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        for suffix, data in [('', body)] + list(compressed_variants(body).items()):
+            with open(target + suffix, 'wb') as f:
+                f.write(data)
+            self.bytes_written += len(data)
+        return path
+
+    def add_hashed(self, path, body):
+        """Write an asset under a content-hashed name, which can be cached forever, and return that name"""
+        name = self.manifest[path] = self.add(hashed_name(path, body), body)
+        return name
+
+    def publish(self):
+        """Write manifest.json and replace the output directory with the new export"""
+        self.add('manifest.json', json.dumps(self.manifest, indent=2, sort_keys=True).encode('utf-8'))
+        previous = f'{self.output_dir}.old'
+        shutil.rmtree(previous, ignore_errors=True)
+        if os.path.exists(self.output_dir):
+            os.replace(self.output_dir, previous)
+        os.replace(self.build_dir, self.output_dir)
+        shutil.rmtree(previous, ignore_errors=True)
+        return self.output_dir
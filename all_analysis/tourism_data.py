@@ -0,0 +1,234 @@
+# all_analysis/tourism_data.py
+import os
+import re
+import threading
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+import pandas as pd
+
+from all_analysis import config
+from all_analysis.dataset_store import dataset_version, keep_version, load_dataset, load_flags, prefetch, snapshot_names
+from all_analysis.eurostat import BULK_PATTERN, RESIDENCE, nuts_level
+from all_analysis.metrics import registry, timed
+
+# nuts_<level>_<year>[_domestic|_foreigner].xlsx and nuts_<level>_population.xlsx
+FILE_PATTERN = re.compile(
+    r'^nuts_(?P<level>\d)_(?:(?P<year>\d{4})(?:_(?P<origin>domestic|foreigner))?|(?P<population>population))\.xlsx$'
+)
+ORIGINS = ('total', 'domestic', 'foreign', 'population')
+
+# Monthly column labels: M01, 2023M01 or 2023-01
+MONTH_PATTERN = re.compile(r'(?:(\d{4})-?)?M?(\d{2})')
+
+DataFile = namedtuple('DataFile', ['path', 'level', 'origin', 'year'])
+
+
+def is_data_file(name):
+    """Whether a file name is a workbook or a Eurostat bulk file the analyzers read"""
+    return FILE_PATTERN.match(name) is not None or BULK_PATTERN.match(name) is not None
+
+
+def discover_files(data_dir=None):
+    """List the workbooks in the data directory with the level, origin and year they hold
+
+    A Eurostat bulk file holds every configured level and origin, so it is
+    listed once for each of them, without a year. Files are listed in order
+    of precedence, lowest first: workbooks, then bulk files (TSV or SDMX-CSV
+    alike), each by name.
+    """
+    data_dir = config.DATA_DIR if data_dir is None else data_dir
+    files = []
+    bulk_files = []
+    for name in snapshot_names(data_dir) or sorted(os.listdir(data_dir)):
+        if BULK_PATTERN.match(name):
+            path = os.path.join(data_dir, name)
+            bulk_files.extend(DataFile(path, level, origin, None)
+                              for level in config.EUROSTAT_LEVELS for origin in RESIDENCE.values())
+            continue
+        match = FILE_PATTERN.match(name)
+        if match is None:
+            continue
+        if match['population']:
+            origin, year = 'population', None
+        else:
+            origin = {'domestic': 'domestic', 'foreigner': 'foreign'}.get(match['origin'], 'total')
+            year = int(match['year'])
+        files.append(DataFile(os.path.join(data_dir, name), int(match['level']), origin, year))
+    return files + bulk_files
+
+
+def series_files(level, origin, data_dir=None):
+    """Paths of the workbooks that make up one NUTS level and origin"""
+    return [f.path for f in discover_files(data_dir) if f.level == level and f.origin == origin]
+
+
+def series_version(level, origin, data_dir=None):
+    """Version of the workbooks that make up one NUTS level and origin, None when there are none"""
+    paths = series_files(level, origin, data_dir)
+    return dataset_version(paths)[0] if paths else None
+
+
+def parse_periods(labels, year=None):
+    """Map column labels (M01, 2023M01, 2023-01 or 2023) to year and month arrays"""
+    years = np.empty(len(labels), dtype=np.int16)
+    months = np.empty(len(labels), dtype=np.int16)
+    for i, label in enumerate(labels):
+        text = str(label).strip()
+        match = MONTH_PATTERN.fullmatch(text)
+        if match:
+            years[i] = int(match[1]) if match[1] else year
+            months[i] = int(match[2])
+        else:
+            # Annual columns (population tables) have no month
+            years[i] = int(float(text))
+            months[i] = 0
+    return years, months
+
+
+def to_long(data_file):
+    """Turn one cleaned workbook into long arrays of region, year, month, value and flags"""
+    frame = load_dataset(data_file.path)
+    flags = load_flags(data_file.path)
+    if BULK_PATTERN.match(os.path.basename(data_file.path)):
+        # Bulk files hold every level and origin, with rows indexed by origin
+        rows = (frame.index == data_file.origin) & (nuts_level(frame.iloc[:, 0]) == data_file.level)
+        frame, flags = frame[rows], flags[rows]
+    labels = frame.iloc[:, 0].astype(str).to_numpy()
+    block = frame.iloc[:, 1:].to_numpy()
+    years, months = parse_periods(frame.columns[1:], data_file.year)
+
+    # Missing cells are not stored at all
+    rows, cols = np.nonzero(~np.isnan(block))
+    return labels[rows], years[cols], months[cols], block[rows, cols].astype(np.float32), flags[rows, cols]
+
+
+class TourismSeries:
+    """Long, compactly typed observations for one NUTS level and origin
+
+    Rows are (region, year, month, value, flags) with categorical region codes,
+    int16 year/month (month 0 for annual data) and float32 values. A dense
+    region × period matrix is built on demand for aggregation.
+    """
+
+    def __init__(self, level, origin, table, version):
+        self.level = level
+        self.origin = origin
+        self.table = table
+        self.version = version
+        self._matrix = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_files(cls, level, origin, data_files, version):
+        """Build a series from the workbooks that hold it"""
+        prefetch(f.path for f in data_files)
+        parts = [to_long(f) for f in data_files]
+        regions, years, months, values, flags = (np.concatenate(arrays) for arrays in zip(*parts))
+
+        table = pd.DataFrame({
+            'region': pd.Categorical(regions, categories=pd.unique(regions)),
+            'year': years,
+            'month': months,
+            'value': values,
+            'flags': flags,
+        })
+        # Files come in order of precedence (see discover_files): an observation held by several
+        # is taken from the last, so Eurostat bulk files win over workbooks whatever their names
+        table = table.drop_duplicates(['region', 'year', 'month'], keep='last', ignore_index=True)
+        return cls(level, origin, table, version)
+
+    @property
+    def regions(self):
+        """Region codes in order of first appearance"""
+        return self.table['region'].cat.categories
+
+    def years(self):
+        """Years with at least one observation, in ascending order"""
+        return sorted(int(y) for y in np.unique(self.table['year'].to_numpy()))
+
+    def matrix(self):
+        """Return (regions, periods, values) with values as a region × period float32 array"""
+        with self._lock:
+            if self._matrix is None:
+                period_keys = self.table['year'].to_numpy(np.int32) * 100 + self.table['month'].to_numpy()
+                periods, period_codes = np.unique(period_keys, return_inverse=True)
+                values = np.full((len(self.regions), len(periods)), np.nan, dtype=np.float32)
+                values[self.table['region'].cat.codes.to_numpy(), period_codes] = self.table['value'].to_numpy()
+                values.flags.writeable = False
+                period_index = pd.MultiIndex.from_arrays(
+                    [(periods // 100).astype(np.int16), (periods % 100).astype(np.int16)], names=['year', 'month'])
+                self._matrix = (self.regions, period_index, values)
+            return self._matrix
+
+    def wide(self, year=None):
+        """Region × period frame (float64) in the layout of the original workbooks
+
+        Monthly data for a single year gets M01..M12 columns, annual data gets
+        one column per year. Regions without any value in the selection are left out.
+        """
+        regions, periods, values = self.matrix()
+        selected = np.ones(len(periods), dtype=bool) if year is None else periods.get_level_values('year') == year
+        block = values[:, selected].astype(np.float64)
+        keep = ~np.isnan(block).all(axis=1)
+
+        period_years = periods.get_level_values('year')[selected]
+        period_months = periods.get_level_values('month')[selected]
+        if (period_months == 0).all():
+            columns = [int(y) for y in period_years]
+        elif year is not None:
+            columns = [f'M{m:02d}' for m in period_months]
+        else:
+            columns = [f'{y}M{m:02d}' for y, m in zip(period_years, period_months)]
+
+        frame = pd.DataFrame(block[keep], columns=columns)
+        frame.insert(0, 'GEO', np.asarray(regions)[keep])
+        return frame
+
+    @property
+    def nbytes(self):
+        """Memory held by the long table"""
+        return int(self.table.memory_usage(deep=True).sum())
+
+
+# (data_dir, level, origin) -> {version: series}
+_series = {}
+_series_lock = threading.Lock()
+
+
+def load_series(level, origin, data_dir=None):
+    """Return the series for a NUTS level and origin, rebuilding it only when its files change"""
+    files = [f for f in discover_files(data_dir) if f.level == level and f.origin == origin]
+    if not files:
+        raise FileNotFoundError(f'No {origin} data files for NUTS{level}')
+    version = dataset_version([f.path for f in files])[0]
+
+    key = (data_dir, level, origin)
+    series = _series.get(key, {}).get(version)
+    if series is None:
+        with _series_lock:
+            series = _series.get(key, {}).get(version)
+            if series is None:
+                with timed('series_build'):
+                    series = TourismSeries.from_files(level, origin, files, version)
+                keep_version(_series.setdefault(key, OrderedDict()), version, series)
+                registry.set('tourism_dataset_rows', len(series.table), level=level, origin=origin)
+                registry.set('tourism_dataset_bytes', series.nbytes, level=level, origin=origin)
+    return series
+
+
+def prune_series():
+    """Drop the versions of every series that are no longer served"""
+    with _series_lock:
+        for (data_dir, level, origin), versions in list(_series.items()):
+            version = series_version(level, origin, data_dir)
+            for stale in [v for v in versions if v != version]:
+                del versions[stale]
+            if not versions:
+                del _series[(data_dir, level, origin)]
+
+
+def clear_series():
+    """Drop every cached series"""
+    with _series_lock:
+        _series.clear()
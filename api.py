@@ -0,0 +1,158 @@
+# api.py
+from flask import Blueprint, jsonify, request
+
+from all_analysis.errors import QueryError
+
+# The data modules (and with them pandas and NumPy) are imported by the views
+# that use them, so registering the blueprint stays cheap
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+MAX_PER_PAGE = 1000
+
+
+def _int_arg(name, default, low=1, high=None):
+    value = request.args.get(name, default)
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise QueryError(f'{name} must be an integer') from None
+    if high is None and value < low:
+        raise QueryError(f'{name} must be at least {low}')
+    if high is not None and not low <= value <= high:
+        raise QueryError(f'{name} must be between {low} and {high}')
+    return value
+
+
+def _list_arg(name):
+    return [v.strip() for v in request.args.get(name, '').split(',') if v.strip()]
+
+
+def _cube(level):
+    from all_analysis.cube import load_cube
+
+    try:
+        return load_cube(level)
+    except FileNotFoundError:
+        raise QueryError(f'No data for NUTS{level}') from None
+
+
+def _json(payload):
+    response = jsonify(payload)
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+@api.errorhandler(QueryError)
+def query_error(error):
+    return jsonify({'error': str(error)}), 400
+
+
+@api.route('/levels')
+def levels():
+    """Available NUTS levels with their years, origins and region counts"""
+    from all_analysis.cube import ORIGINS
+    from all_analysis.tourism_data import discover_files
+
+    result = []
+    for level in sorted({f.level for f in discover_files() if f.origin in ORIGINS}):
+        cube = _cube(level)
+        result.append({
+            'level': level,
+            'years': cube.years,
+            'origins': [o for o in ORIGINS if cube.by_year['count'][:, ORIGINS.index(o)].any()],
+            'regions': len(cube.regions),
+        })
+    return _json({'levels': result})
+
+
+@api.route('/nuts<int:level>/regions')
+def regions(level):
+    """Paginated list of region codes, optionally filtered by prefix"""
+    from all_analysis.query import paginate
+
+    cube = _cube(level)
+    prefix = request.args.get('prefix', '')
+    codes = [code for code in cube.regions if code.startswith(prefix)]
+    page = _int_arg('page', 1)
+    per_page = _int_arg('per_page', 100, high=MAX_PER_PAGE)
+    return _json(paginate({'region': codes}, page, per_page))
+
+
+@api.route('/nuts<int:level>/query')
+def query(level):
+    """Aggregate a region/year/month/origin slice of the data
+
+    Query parameters: regions (comma separated codes), years and months
+    (e.g. 2023 or 1-6), origin (total, domestic, foreign), agg (sum, mean,
+    max, min, share), group_by (any of region, year, month, or none),
+    page and per_page.
+    """
+    from all_analysis.query import paginate, parse_range, run_query
+
+    cube = _cube(level)
+    years = parse_range(request.args.get('years'), cube.years, 'years') if 'years' in request.args else [cube.years[-1]]
+    group_by = _list_arg('group_by') or ['region']
+    columns = run_query(
+        cube,
+        regions=_list_arg('regions'),
+        years=years,
+        months=parse_range(request.args.get('months'), range(1, 13), 'months'),
+        origin=request.args.get('origin', 'total'),
+        agg=request.args.get('agg', 'sum'),
+        group_by=() if group_by == ['none'] else tuple(group_by),
+    )
+    page = _int_arg('page', 1)
+    per_page = _int_arg('per_page', 100, high=MAX_PER_PAGE)
+    return _json(paginate(columns, page, per_page))
+
+
+@api.route('/nuts<int:level>/seasonality')
+def seasonality(level):
+    """Seasonality metrics of each region, year and origin
+
+    Query parameters: regions (comma separated codes), years (e.g. 2023 or
+    2019-2023, the latest year by default), origins (any of total, domestic,
+    foreign), sort (a metric, e.g. -seasonality_index for the most seasonal
+    first), page and per_page.
+    """
+    from all_analysis.cube import ORIGINS
+    from all_analysis.query import paginate, parse_range, seasonality_table
+
+    cube = _cube(level)
+    years = parse_range(request.args.get('years'), cube.years, 'years') if 'years' in request.args else [cube.years[-1]]
+    columns = seasonality_table(
+        cube,
+        regions=_list_arg('regions'),
+        years=years,
+        origins=_list_arg('origins') or ORIGINS,
+        sort=request.args.get('sort'),
+    )
+    page = _int_arg('page', 1)
+    per_page = _int_arg('per_page', 100, high=MAX_PER_PAGE)
+    return _json(paginate(columns, page, per_page))
+
+
+@api.route('/nuts<int:level>/growth')
+def growth(level):
+    """Month-over-month, year-over-year, year-to-date and recovery figures of each region and month
+
+    Query parameters: regions (comma separated codes), years and months
+    (e.g. 2023 or 1-6, the latest year by default), origin (total, domestic,
+    foreign), sort (a column, e.g. -yoy for the fastest growing first),
+    page and per_page.
+    """
+    from all_analysis.query import growth_table, paginate, parse_range
+
+    cube = _cube(level)
+    years = parse_range(request.args.get('years'), cube.years, 'years') if 'years' in request.args else [cube.years[-1]]
+    columns = growth_table(
+        cube,
+        regions=_list_arg('regions'),
+        years=years,
+        months=parse_range(request.args.get('months'), range(1, 13), 'months'),
+        origin=request.args.get('origin', 'total'),
+        sort=request.args.get('sort'),
+    )
+    page = _int_arg('page', 1)
+    per_page = _int_arg('per_page', 100, high=MAX_PER_PAGE)
+    return _json(paginate(columns, page, per_page))
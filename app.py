@@ -1,13 +1,182 @@
 # app.py
-from flask import Flask, render_template
-from all_analysis.nuts1_and_nuts2 import DataAnalyzer
-from all_analysis.nuts1_foreign_domestic import ForeignDomesticAnalyzer
-from all_analysis.nuts2_foreign_domestic import NUTS2ForeignDomesticAnalyzer
-from all_analysis.population_accommodation import PopulationAccommodationAnalyzer
+import time
+
+STARTED = time.perf_counter()
 
 import json
+import sys
+
+import click
+from flask import Flask, Response, abort, copy_current_request_context, g, render_template, request, url_for
+from api import api
+from all_analysis import config
+from all_analysis.metrics import cache_lookup, end_trace, registry, server_timing, start_trace, timed
+from all_analysis.profiler import Sampler, write_profile
+from all_analysis.registry import ANALYZERS, analyzer_class, analyzer_classes
+from all_analysis.response_cache import ResponseCache
+from all_analysis.single_flight import FlightTimeout, SingleFlight
 
+# The analyzers, and with them pandas, NumPy and plotly, are imported on the
+# first request that needs them (see all_analysis.registry)
 app = Flask(__name__)
+app.register_blueprint(api)
+response_cache = ResponseCache(config.RESPONSE_CACHE_MAX_BYTES)
+sampler = Sampler(config.PROFILE_INTERVAL_MS / 1000)
+renders = SingleFlight('render')
+
+data_manager = None
+if config.DATA_RELOAD_INTERVAL:
+    # Hot reload needs the data modules, so it is the one setting that loads them at startup
+    from all_analysis.data_manager import DataManager
+
+    data_manager = DataManager().start()
+
+# Dashboard name -> endpoint of its page
+PAGE_ENDPOINTS = {
+    'nuts1_and_nuts2': 'nuts_analysis',
+    'nuts1_foreign_domestic': 'foreign_domestic',
+    'nuts2_foreign_domestic': 'nuts2_foreign_domestic',
+    'population_accommodation': 'population_accommodation',
+}
+
+
+def cached_response(name, data_files, render, mimetype='text/html'):
+    """Serve a rendered body from the response cache, answering conditional GETs with 304"""
+    from all_analysis.dataset_store import dataset_version
+
+    version, last_modified = dataset_version(data_files)
+    entry = response_cache.get(name, version)
+    cache_lookup('response', entry is not None)
+    if entry is None:
+        def build():
+            with timed('render'):
+                body = render().encode('utf-8')
+            return response_cache.put(name, version, body, last_modified)
+
+        stale = response_cache.latest(name) if config.STALE_WHILE_REVALIDATE else None
+        if stale is not None:
+            # The previous version is served until the new one is cached
+            renders.start((name, version), copy_current_request_context(build))
+            entry = stale
+        else:
+            # Concurrent requests for the same response wait for one render
+            try:
+                entry = renders.do((name, version), build, config.SINGLE_FLIGHT_TIMEOUT)
+            except FlightTimeout:
+                response = Response('Still rendering, try again shortly', status=503, mimetype='text/plain')
+                response.retry_after = 5
+                return response
+
+    encoding = negotiate_encoding(entry.body)
+    if encoding is None:
+        response = Response(entry.body, mimetype=mimetype)
+        response.set_etag(entry.etag)
+    else:
+        response = Response(response_cache.encoded(name, entry, encoding), mimetype=mimetype)
+        response.content_encoding = encoding
+        # Each representation has its own validator
+        response.set_etag(f'{entry.etag}-{encoding}')
+    response.vary.add('Accept-Encoding')
+    response.last_modified = entry.last_modified
+    # Clients keep their copy but revalidate it on every load
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+def negotiate_encoding(body):
+    """The content coding the client prefers among those we produce, None to send the body as is"""
+    from all_analysis.compression import ENCODINGS, MIN_SIZE
+
+    if not config.COMPRESS_RESPONSES or len(body) < MIN_SIZE:
+        return None
+    encoding = request.accept_encodings.best_match(ENCODINGS)
+    return encoding if encoding and request.accept_encodings[encoding] else None
+
+
+@app.context_processor
+def template_helpers():
+    return {'plotly_js_url': config.PLOTLY_JS_URL, 'page_url': page_url}
+
+
+def render_page(template, **context):
+    """Render a dashboard template, timing it as its own stage"""
+    with timed('template_render'):
+        return render_template(template, **context)
+
+
+def plot_urls(page):
+    """URLs the page template fetches its figures from"""
+    exported = g.get('exported_plots')
+    if exported is not None:
+        return exported[page]
+    return {name: url_for('plot', page=page, name=name) for name in analyzer_class(page).PLOTS}
+
+
+def page_url(endpoint):
+    """Link to a page: its route, or its file in a static export"""
+    exported = g.get('exported_pages')
+    return exported[endpoint] if exported is not None else url_for(endpoint)
+
+
+def render_dashboard(page):
+    """Render the template of a dashboard (templates/<page>.html) from its analyzer's summaries"""
+    analysis = analyzer_class(page)().get_analysis()
+    if page == 'nuts1_and_nuts2':
+        context = {'nuts1': analysis[0], 'nuts2': analysis[1]}
+    else:
+        context = {'analysis': analysis}
+    from all_analysis.figures import shared_templates
+
+    return render_page(f'{page}.html', plot_urls=plot_urls(page),
+                       plot_templates=shared_templates() if config.PLOT_SHARED_TEMPLATES else {}, **context)
+
+
+@app.before_request
+def start_request_timing():
+    g.request_start = time.perf_counter()
+    g.trace_token = start_trace()
+    if config.PROFILE_SLOW_MS:
+        g.profile = sampler.start()
+
+
+@app.after_request
+def record_request_timing(response):
+    seconds = time.perf_counter() - g.request_start
+    trace = end_trace(g.pop('trace_token'))
+    registry.observe('tourism_request_seconds', seconds, endpoint=request.endpoint or 'unknown',
+                     method=request.method, status=response.status_code)
+    if config.SERVER_TIMING:
+        response.headers['Server-Timing'] = server_timing(trace + [('total', seconds)])
+
+    profile = g.pop('profile', None)
+    if profile is not None:
+        sampler.stop(profile)
+        if seconds * 1000 >= config.PROFILE_SLOW_MS and profile.stacks:
+            write_profile(profile, config.PROFILE_DIR, f'{request.method}-{request.path}', seconds)
+    return response
+
+
+@app.teardown_request
+def stop_request_timing(error):
+    # after_request is skipped when a view raises; never leave a trace or sampler running
+    token = g.pop('trace_token', None)
+    if token is not None:
+        end_trace(token)
+    profile = g.pop('profile', None)
+    if profile is not None:
+        sampler.stop(profile)
+
+
+@app.route('/metrics')
+def metrics():
+    """Request, stage, cache and dataset metrics in the Prometheus text format"""
+    registry.set('tourism_response_cache_bytes', response_cache.size)
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/healthz')
+def healthz():
+    """Liveness check that never loads data"""
+    return Response('ok', mimetype='text/plain')
 
 @app.route('/')
 def index():
@@ -15,39 +184,168 @@ def index():
 
 @app.route('/nuts1_and_nuts2')
 def nuts_analysis():
-    analyzer = DataAnalyzer()
-    nuts1_analysis, nuts2_analysis, plot_data = analyzer.get_full_analysis()
-    return render_template('nuts1_and_nuts2.html', 
-                         nuts1=nuts1_analysis,
-                         nuts2=nuts2_analysis,
-                         plot_data=plot_data)
+    return cached_response('nuts1_and_nuts2', analyzer_class('nuts1_and_nuts2').data_files(),
+                           lambda: render_dashboard('nuts1_and_nuts2'))
 
 @app.route('/nuts1_foreign-domestic')
 def foreign_domestic():
-    analyzer = ForeignDomesticAnalyzer()
-    analysis, plot_data = analyzer.get_full_analysis()
-    return render_template('nuts1_foreign_domestic.html',
-                         analysis=analysis,
-                         plot_data=plot_data)
+    return cached_response('nuts1_foreign_domestic', analyzer_class('nuts1_foreign_domestic').data_files(),
+                           lambda: render_dashboard('nuts1_foreign_domestic'))
 
 
 @app.route('/nuts2-foreign-domestic')
 def nuts2_foreign_domestic():
-    analyzer = NUTS2ForeignDomesticAnalyzer()
-    analysis, plot_data = analyzer.get_full_analysis()
-    return render_template('nuts2_foreign_domestic.html',
-                         analysis=analysis,
-                         plot_data=plot_data)
+    return cached_response('nuts2_foreign_domestic', analyzer_class('nuts2_foreign_domestic').data_files(),
+                           lambda: render_dashboard('nuts2_foreign_domestic'))
 
 
 @app.route('/population-accommodation')
 def population_accommodation():
-    analyzer = PopulationAccommodationAnalyzer()
-    analysis, plot_data = analyzer.get_full_analysis()
-    return render_template('population_accommodation.html',
-                         analysis=analysis,
-                         plot_data=plot_data)
+    return cached_response('population_accommodation', analyzer_class('population_accommodation').data_files(),
+                           lambda: render_dashboard('population_accommodation'))
+
+
+@app.route('/plots/<page>/<name>.json')
+def plot(page, name):
+    """Serve one dashboard figure as Plotly JSON, optionally at full detail for an x range (x0, x1)"""
+    if page not in ANALYZERS or name not in analyzer_class(page).PLOTS:
+        abort(404)
+    plot_analyzer = analyzer_class(page)
+    if 'x0' not in request.args and 'x1' not in request.args:
+        return cached_response(f'plot:{page}:{name}', plot_analyzer.data_files(),
+                               lambda: plot_analyzer().get_plot(name), mimetype='application/json')
+
+    try:
+        x0, x1 = float(request.args['x0']), float(request.args['x1'])
+    except (KeyError, ValueError):
+        abort(400, 'x0 and x1 must both be numbers')
+    if not x0 <= x1:
+        abort(400, 'x0 must not be greater than x1')
+    # Zooms that select the same points share one render and one cache entry
+    x0, x1 = plot_analyzer().plot_window(name, x0, x1)
+    return cached_response(f'plot:{page}:{name}:{x0}:{x1}', plot_analyzer.data_files(),
+                           lambda: plot_analyzer().get_plot_window(name, x0, x1), mimetype='application/json')
+
+
+def use_processes(enabled):
+    # CLI commands own their process, so they may run the executor on a process pool
+    if enabled:
+        config.EXECUTION_MODE = 'process'
+
+
+@app.cli.command('warm-cache')
+@click.option('--processes', is_flag=True, help='Parse workbooks and build figures in worker processes')
+def warm_cache(processes):
+    """Load every workbook once so the columnar cache is written before serving"""
+    use_processes(processes)
+    for cls in analyzer_classes().values():
+        start = time.perf_counter()
+        cls()
+        click.echo(f"{cls.__name__}: {time.perf_counter() - start:.3f}s")
+
+
+@app.cli.command('export-static')
+@click.argument('output_dir', type=click.Path(file_okay=False))
+@click.option('--processes', is_flag=True, help='Parse workbooks and build figures in worker processes')
+def export_static(output_dir, processes):
+    """Pre-render every dashboard and its figures to OUTPUT_DIR for a plain web server
+
+    Pages keep their template names (nuts1_and_nuts2.html, ...); figures get
+    content-hashed names so they can be cached forever. Every file has a
+    precompressed .gz (and .br when brotli is installed) variant next to it.
+    """
+    from all_analysis.figures import plot_json
+    from all_analysis.compression import ENCODINGS
+    from all_analysis.static_export import StaticSite
+
+    use_processes(processes)
+    site = StaticSite(output_dir)
+    exported_plots = {}
+    for page, cls in analyzer_classes().items():
+        start = time.perf_counter()
+        analyzer = cls()
+        exported_plots[page] = {}
+        for name, method in cls.PLOTS.items():
+            # Zoomed-in detail needs the Flask app, so static figures are not marked as reduced
+            body = plot_json(getattr(analyzer, method)(), lod=False).encode('utf-8')
+            exported_plots[page][name] = site.add_hashed(f'plots/{page}/{name}.json', body)
+        click.echo(f"{page}: {len(cls.PLOTS)} figures in {time.perf_counter() - start:.3f}s")
+
+    exported_pages = {'index': 'index.html', **{PAGE_ENDPOINTS[page]: f'{page}.html' for page in ANALYZERS}}
+    with app.test_request_context():
+        g.exported_plots = exported_plots
+        g.exported_pages = exported_pages
+        site.add('index.html', render_template('index.html').encode('utf-8'))
+        for page in ANALYZERS:
+            site.add(f'{page}.html', render_dashboard(page).encode('utf-8'))
+
+    click.echo(f"Wrote {site.bytes_written} bytes to {site.publish()}"
+               f"{'' if 'br' in ENCODINGS else ' (brotli is not installed, so only .gz variants)'}")
+
+
+@app.cli.command('batch')
+@click.argument('spec_file', type=click.File('r'))
+@click.argument('output', type=click.Path())
+@click.option('--format', 'output_format', type=click.Choice(['jsonl', 'csv', 'parquet']), default='jsonl',
+              help='jsonl or csv file, or a directory of parquet parts')
+@click.option('--workers', type=int, default=None, help='Worker processes, one per CPU by default; 1 runs every job here')
+@click.option('--resume', is_flag=True, help='Keep the rows already in OUTPUT and run only the missing tasks')
+@click.option('--processes', is_flag=True, help='Parse workbooks and build figures in worker processes')
+def batch(spec_file, output, output_format, workers, resume, processes):
+    """Run the analyses of a JSON job spec for many region subsets and years and stream the rows to OUTPUT
+
+    The spec is {"jobs": [{"name": "alps", "level": 2, "regions": ["AT32", "AT33"],
+    "years": "2019-2023", "origins": ["domestic", "foreign"], "analyses": ["summary",
+    "seasonal", "intensity"]}, ...]}; see all_analysis.batch.expand_jobs.
+    """
+    from all_analysis.batch import OUTPUT_FORMATS, expand_jobs, run_batch
+    from all_analysis.errors import QueryError
+
+    use_processes(processes)
+    start = time.perf_counter()
+    try:
+        tasks = expand_jobs(json.load(spec_file))
+        output = OUTPUT_FORMATS[output_format](output, resume=resume)
+    except (QueryError, ValueError, ImportError) as e:
+        raise click.ClickException(str(e))
+    written, skipped, failed = run_batch(tasks, output, workers or config.MAX_WORKERS, on_error=click.echo)
+    click.echo(f"{written} tasks written, {skipped} already done, {failed} failed "
+               f"in {time.perf_counter() - start:.3f}s")
+    if failed:
+        raise SystemExit(1)
+
+
+@app.cli.command('check-figures')
+@click.option('--backend', type=click.Choice(config.PLOT_BACKENDS), default=None, help='Backend to check, the configured one by default')
+def check_figures(backend):
+    """Check that every figure serializes to the same figure as the validated plotly path"""
+    from all_analysis.figures import equivalent
+
+    failed = 0
+    for page, cls in analyzer_classes().items():
+        analyzer = cls()
+        for name, method in cls.PLOTS.items():
+            same = equivalent(getattr(analyzer, method)(), backend)
+            failed += not same
+            click.echo(f"{page}/{name}: {'ok' if same else 'DIFFERENT'}")
+    if failed:
+        raise SystemExit(1)
+
+
+@app.cli.command('startup-report')
+def startup_report():
+    """Show how long the app took to import and which heavy modules it loaded"""
+    click.echo(f"startup: {registry.value('tourism_startup_seconds'):.3f}s")
+    for module in ('numpy', 'pandas', 'plotly'):
+        click.echo(f"{module}: {'loaded' if module in sys.modules else 'not loaded'}")
+    for page, (module, _) in ANALYZERS.items():
+        start = time.perf_counter()
+        analyzer_class(page)
+        click.echo(f"{page}: {module} imported in {time.perf_counter() - start:.3f}s")
+
+
+registry.set('tourism_startup_seconds', time.perf_counter() - STARTED)
 
 
 if __name__ == '__main__':
-    app.run(debug=True, port=5000)
\ No newline at end of file
+    app.run(debug=True, port=5000)
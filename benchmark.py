@@ -0,0 +1,297 @@
+# benchmark.py
+"""Time every stage of the dashboards on the bundled data and on scaled copies of it
+
+    python benchmark.py --scale 1 --scale 10 --scale 100 --output results.json
+    python benchmark.py --compare results.json --max-regression 1.25
+
+A scale of N multiplies the number of observations by roughly N, split
+between regions and years (100 gives 10× the regions over 10× the years);
+REGIONSxYEARS (e.g. 10x1) sets both factors explicitly. Each scale runs in
+a fresh interpreter so its peak RSS is reported on its own.
+"""
+import argparse
+import contextlib
+import json
+import math
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from all_analysis import config, executor
+from all_analysis.cleaning import clean_workbook
+from all_analysis.computation import ComputationGraph, clear_graphs
+from all_analysis.cube import clear_cubes
+from all_analysis.dataset_store import store
+from all_analysis.registry import analyzer_classes
+from all_analysis.tourism_data import clear_series, discover_files
+
+# Analysis steps timed for each analyzer, in evaluation order
+ANALYSES = {
+    'DataAnalyzer': ('analyze_nuts1', 'analyze_nuts2'),
+    'ForeignDomesticAnalyzer': ('analyze_data',),
+    'NUTS2ForeignDomesticAnalyzer': ('analyze_data',),
+    'PopulationAccommodationAnalyzer': ('calculate_intensity_metrics', 'analyze_seasonal_patterns'),
+}
+
+
+def parse_scale(text):
+    """Turn '100' or '10x2' into (regions factor, years factor)"""
+    if 'x' in text:
+        regions, years = (int(v) for v in text.split('x', 1))
+    else:
+        scale = int(text)
+        years = max(1, math.isqrt(scale))
+        regions = math.ceil(scale / years)
+    if regions < 1 or years < 1:
+        raise argparse.ArgumentTypeError(f'Invalid scale {text!r}')
+    return regions, years
+
+
+def make_synthetic(source_dir, target_dir, regions_factor, years_factor):
+    """Write scaled copies of the source workbooks: regions repeated with suffixed codes, earlier years added"""
+    if os.path.isdir(target_dir):
+        return target_dir
+    tmp_dir = f'{target_dir}.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    for data_file in discover_files(source_dir):
+        raw = pd.read_excel(data_file.path)
+        # The first row is the GEO header row, the rest are regions
+        header, body = raw.iloc[:1], raw.iloc[1:]
+        copies = []
+        for k in range(regions_factor):
+            copy = body.copy()
+            if k:
+                copy.iloc[:, 0] = copy.iloc[:, 0].astype(str) + f'-{k}'
+            copies.append(copy)
+        scaled = pd.concat([header] + copies, ignore_index=True)
+
+        name = os.path.basename(data_file.path)
+        if data_file.year is None:
+            scaled.to_excel(os.path.join(tmp_dir, name), index=False)
+            continue
+        for y in range(years_factor):
+            year_name = name.replace(str(data_file.year), str(data_file.year - y), 1)
+            scaled.to_excel(os.path.join(tmp_dir, year_name), index=False)
+    os.replace(tmp_dir, target_dir)
+    return target_dir
+
+
+def summarize(samples):
+    """p50/p95/min/max of a list of durations in seconds"""
+    values = np.asarray(samples)
+    return {
+        'runs': len(values),
+        'p50': float(np.percentile(values, 50)),
+        'p95': float(np.percentile(values, 95)),
+        'min': float(values.min()),
+        'max': float(values.max()),
+    }
+
+
+class Timings:
+    """Collect repeated durations per stage name"""
+
+    def __init__(self):
+        self.samples = {}
+
+    def add(self, name, seconds):
+        self.samples.setdefault(name, []).append(seconds)
+
+    @contextlib.contextmanager
+    def time(self, name):
+        start = time.perf_counter()
+        yield
+        self.add(name, time.perf_counter() - start)
+
+    def summary(self):
+        return {name: summarize(samples) for name, samples in self.samples.items()}
+
+
+def reset_memory():
+    """Forget every in-memory dataset, series, cube and memoized result"""
+    store.clear()
+    clear_series()
+    clear_cubes()
+    clear_graphs()
+
+
+def bench_files(timings, repeat):
+    for _ in range(repeat):
+        read = clean = 0.0
+        for data_file in discover_files():
+            start = time.perf_counter()
+            raw = pd.read_excel(data_file.path)
+            read += time.perf_counter() - start
+            start = time.perf_counter()
+            clean_workbook(raw)
+            clean += time.perf_counter() - start
+        timings.add('read_excel (all files)', read)
+        timings.add('clean_workbook (all files)', clean)
+
+
+def bench_analyzer(timings, analyzer_class, repeat):
+    name = analyzer_class.__name__
+    for _ in range(repeat):
+        reset_memory()
+        shutil.rmtree(config.CACHE_DIR, ignore_errors=True)
+        with timings.time(f'{name}.load_data (cold)'):
+            analyzer_class()
+        # Without published cubes, so the cubes are rebuilt from the columnar disk cache
+        reset_memory()
+        shutil.rmtree(config.SHARED_CUBE_DIR, ignore_errors=True)
+        with timings.time(f'{name}.load_data (disk cache)'):
+            analyzer_class()
+        reset_memory()
+        with timings.time(f'{name}.load_data (shared cube)'):
+            analyzer_class()
+        with timings.time(f'{name}.load_data (memory)'):
+            analyzer = analyzer_class()
+
+        # A private graph so every step is computed rather than served from memory
+        analyzer.graph = ComputationGraph(name, None)
+        for step in ANALYSES[name]:
+            with timings.time(f'{name}.{step}'):
+                getattr(analyzer, step)()
+        for plot, plot_method in analyzer_class.PLOTS.items():
+            with timings.time(f'{name}.{plot_method}'):
+                getattr(analyzer, plot_method)()
+            # The spec is memoized now, so this is the encoding alone
+            with timings.time(f'{name}.{plot_method} (serialize)'):
+                analyzer.get_plot(plot)
+
+        analyzer.graph = ComputationGraph(name, None)
+        with timings.time(f'{name}.get_full_analysis'):
+            analyzer.get_full_analysis()
+
+
+def bench_routes(timings, repeat):
+    from app import app, response_cache
+
+    client = app.test_client()
+    paths = ['/nuts1_and_nuts2', '/nuts1_foreign-domestic', '/nuts2-foreign-domestic', '/population-accommodation']
+    paths += [f'/plots/{page}/{plot}.json' for page, analyzer_class in analyzer_classes().items()
+              for plot in analyzer_class.PLOTS]
+    for _ in range(repeat):
+        # Data stays loaded; every response is rendered from scratch
+        response_cache.clear()
+        clear_graphs()
+        for path in paths:
+            with timings.time(f'GET {path} (render)'):
+                response = client.get(path)
+            if response.status_code != 200:
+                raise RuntimeError(f'GET {path} returned {response.status_code}')
+        for path in paths:
+            with timings.time(f'GET {path} (cached)'):
+                client.get(path)
+
+
+def run_scale(data_dir, work_dir, repeat):
+    """Benchmark every stage on one data directory; runs in its own process"""
+    config.DATA_DIR = data_dir
+    config.CACHE_DIR = os.path.join(work_dir, 'cache')
+    config.SHARED_CUBE_DIR = os.path.join(config.CACHE_DIR, 'cubes')
+    timings = Timings()
+    try:
+        bench_files(timings, repeat)
+        for analyzer_class in analyzer_classes().values():
+            bench_analyzer(timings, analyzer_class, repeat)
+        bench_routes(timings, repeat)
+    finally:
+        # Worker pools would otherwise keep this process from exiting
+        executor.shutdown()
+
+    files = discover_files()
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    rss_unit = 1 if sys.platform == 'darwin' else 1024
+    return {
+        'files': len(files),
+        'file_bytes': sum(os.path.getsize(f.path) for f in files),
+        'observations': int(sum(store.get(f.path).iloc[:, 1:].notna().to_numpy().sum() for f in files)),
+        'peak_rss_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * rss_unit,
+        'peak_rss_children_bytes': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * rss_unit,
+        'stages': timings.summary(),
+    }
+
+
+def compare(current, baseline, max_regression):
+    """List the stages whose p50 grew by more than max_regression× over the baseline"""
+    regressions = []
+    baseline_runs = {run['scale']: run for run in baseline['runs']}
+    for run in current['runs']:
+        base_run = baseline_runs.get(run['scale'])
+        if base_run is None:
+            continue
+        for stage, stats in run['stages'].items():
+            base_stats = base_run['stages'].get(stage)
+            if base_stats and base_stats['p50'] > 0 and stats['p50'] / base_stats['p50'] > max_regression:
+                regressions.append((run['scale'], stage, base_stats['p50'], stats['p50']))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', action='append', type=str,
+                        help='Data scale to run (N or REGIONSxYEARS), repeatable; default 1, 10 and 100')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per stage')
+    parser.add_argument('--output', help='Write the results to this JSON file instead of stdout')
+    parser.add_argument('--work-dir', default=os.path.join('cache', 'benchmark'),
+                        help='Where synthetic data and benchmark caches are kept')
+    parser.add_argument('--compare', help='Baseline results file to check for regressions')
+    parser.add_argument('--max-regression', type=float, default=1.25,
+                        help='Largest allowed p50 ratio against the baseline')
+    args = parser.parse_args(argv)
+
+    results = {
+        'created': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'execution_mode': config.EXECUTION_MODE,
+        'max_workers': config.MAX_WORKERS,
+        'repeat': args.repeat,
+        'runs': [],
+    }
+    for scale in args.scale or ['1', '10', '100']:
+        regions_factor, years_factor = parse_scale(scale)
+        if (regions_factor, years_factor) == (1, 1):
+            data_dir = config.DATA_DIR
+        else:
+            print(f'Generating {regions_factor}x regions, {years_factor}x years...', file=sys.stderr)
+            data_dir = make_synthetic(config.DATA_DIR, os.path.join(args.work_dir, f'data-{regions_factor}x{years_factor}'),
+                                      regions_factor, years_factor)
+        print(f'Running scale {scale}...', file=sys.stderr)
+        # A fresh interpreter per scale keeps peak RSS and warm caches separate
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+            run = pool.submit(run_scale, data_dir, os.path.join(args.work_dir, f'run-{scale}'), args.repeat).result()
+        results['runs'].append({'scale': scale, 'regions_factor': regions_factor,
+                                'years_factor': years_factor, **run})
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.max_regression)
+        for scale, stage, before, after in regressions:
+            print(f'REGRESSION scale {scale}: {stage} p50 {before:.4f}s -> {after:.4f}s', file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())